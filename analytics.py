@@ -0,0 +1,235 @@
+import time
+from collections import Counter
+
+from flask import Blueprint, abort, current_app, g, jsonify, render_template, request
+from flask_login import current_user, login_required
+from sqlalchemy import Column, Float, Integer, String, Table, delete, distinct, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from matching import MULTI_SELECT_CRITERIA
+
+# The one row of the state table
+STATE_ID = 1
+
+
+class PortfolioAnalytics:
+    # Portfolio-wide counts over all projects: how many projects selected each technique,
+    # gave each answer per criterion (each reporting area and subsection counted on its
+    # own), and in total.
+    #
+    # The counts are materialized in summary tables. refresh() rebuilds them with
+    # grouped SQL aggregates (see refresh_analytics.py); after that every change to
+    # answers or selections applies its +/- deltas in the same transaction (the
+    # answers_changed(), techniques_changed() and project_removed() calls in app.py), so
+    # reading them never touches the project tables. Until the first refresh deltas are
+    # ignored, and the admin page runs it on first use.
+    #
+    # Users named in ADMIN_USERNAMES see the counts on /admin/analytics (and as JSON with
+    # ?format=json).
+
+    def __init__(self, db):
+        self.db = db
+        self.technique_adoption = Table(
+            'analytics_technique_adoption', db.metadata,
+            Column('technique_name', String(100), primary_key=True),
+            Column('projects', Integer, nullable=False),
+        )
+        self.answer_counts = Table(
+            'analytics_answer_count', db.metadata,
+            Column('criteria_id', Integer, primary_key=True),
+            Column('answer', String(200), primary_key=True),
+            Column('projects', Integer, nullable=False),
+        )
+        self.state = Table(
+            'analytics_state', db.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('refreshed_at', Float, nullable=False),
+        )
+
+    def init_app(self, app):
+        app.config.setdefault('ADMIN_USERNAMES', ())
+
+        blueprint = Blueprint('analytics', __name__)
+        blueprint.add_url_rule('/admin/analytics', 'analytics', login_required(self.analytics_view))
+        app.register_blueprint(blueprint)
+
+    def _table(self, name):
+        return self.db.metadata.tables[name]
+
+    def multi_select_criteria_ids(self):
+        # Read once per request (or command), however many writes apply deltas
+        if 'analytics_multi_select_ids' not in g:
+            criteria = self._table('criteria')
+            g.analytics_multi_select_ids = {
+                criteria_id for (criteria_id,) in self.db.session.execute(
+                    select(criteria.c.id).where(criteria.c.name.in_(MULTI_SELECT_CRITERIA))
+                )
+            }
+        return g.analytics_multi_select_ids
+
+    @staticmethod
+    def answer_values(criteria_id, answer, multi_select_ids):
+        # The values an answer is counted under; multi-select answers once per name
+        if not answer:
+            return ()
+        if criteria_id in multi_select_ids:
+            return {value for value in answer.split(",") if value}
+        return (answer,)
+
+    def refreshed_at(self):
+        # Read once per request (or command), like multi_select_criteria_ids()
+        if 'analytics_refreshed_at' not in g:
+            g.analytics_refreshed_at = self.db.session.execute(
+                select(self.state.c.refreshed_at).where(self.state.c.id == STATE_ID)
+            ).scalar()
+        return g.analytics_refreshed_at
+
+    def refresh(self):
+        # Rebuild the summary tables from the project tables, in one transaction
+        session = self.db.session
+        g.pop('analytics_multi_select_ids', None)
+        project_criteria = self._table('project_criteria')
+        selected_technique = self._table('selected_technique')
+
+        adoption = session.execute(
+            select(selected_technique.c.technique_name, func.count(distinct(selected_technique.c.project_id)))
+            .group_by(selected_technique.c.technique_name)
+        ).all()
+
+        # Multi-select answers are grouped by their whole value first, then split, so
+        # only one row per distinct combination leaves the database
+        multi_select_ids = self.multi_select_criteria_ids()
+        counts = Counter()
+        for criteria_id, answer, projects in session.execute(
+            select(project_criteria.c.criteria_id, project_criteria.c.answer, func.count())
+            .group_by(project_criteria.c.criteria_id, project_criteria.c.answer)
+        ):
+            for value in self.answer_values(criteria_id, answer, multi_select_ids):
+                counts[(criteria_id, value)] += projects
+
+        session.execute(delete(self.technique_adoption))
+        session.execute(delete(self.answer_counts))
+        if adoption:
+            session.execute(insert(self.technique_adoption), [
+                {'technique_name': technique_name, 'projects': projects} for technique_name, projects in adoption
+            ])
+        if counts:
+            session.execute(insert(self.answer_counts), [
+                {'criteria_id': criteria_id, 'answer': value, 'projects': projects}
+                for (criteria_id, value), projects in counts.items()
+            ])
+        refreshed_at = time.time()
+        session.execute(delete(self.state))
+        session.execute(insert(self.state).values(id=STATE_ID, refreshed_at=refreshed_at))
+        session.commit()
+        g.analytics_refreshed_at = refreshed_at
+
+    def _apply(self, table, key_columns, deltas):
+        # Add the deltas ({key tuple: change}) to the counts, dropping counts that reach 0.
+        # Runs in the caller's transaction. The rows are updated in key order, so that
+        # concurrent saves lock the counters they share in the same order and can't
+        # deadlock.
+        session = self.db.session
+        for key in sorted(deltas):
+            change = deltas[key]
+            if not change:
+                continue
+            where = [table.c[column] == value for column, value in zip(key_columns, key)]
+            updated = session.execute(
+                update(table).where(*where).values(projects=table.c.projects + change)
+            ).rowcount
+            if not updated and change > 0:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(table).values({**dict(zip(key_columns, key)), 'projects': change}))
+                except IntegrityError:
+                    # Inserted by a concurrent request in the meantime
+                    session.execute(update(table).where(*where).values(projects=table.c.projects + change))
+        session.execute(delete(table).where(table.c.projects <= 0))
+
+    def answers_changed(self, changes):
+        # changes: (criteria_id, previous answer or None, new answer or None) per answer
+        if not changes or self.refreshed_at() is None:
+            return
+        multi_select_ids = self.multi_select_criteria_ids()
+        deltas = Counter()
+        for criteria_id, previous, answer in changes:
+            for value in self.answer_values(criteria_id, previous, multi_select_ids):
+                deltas[(criteria_id, value)] -= 1
+            for value in self.answer_values(criteria_id, answer, multi_select_ids):
+                deltas[(criteria_id, value)] += 1
+        self._apply(self.answer_counts, ('criteria_id', 'answer'), deltas)
+
+    def techniques_changed(self, added=(), removed=()):
+        # Technique names newly selected and deselected by one or more projects
+        if not (added or removed) or self.refreshed_at() is None:
+            return
+        deltas = Counter()
+        for technique_name in added:
+            deltas[(technique_name,)] += 1
+        for technique_name in removed:
+            deltas[(technique_name,)] -= 1
+        self._apply(self.technique_adoption, ('technique_name',), deltas)
+
+    def project_removed(self, project_id):
+        # Call before deleting a project, to take its answers and techniques out of the counts
+        if self.refreshed_at() is None:
+            return
+        project_criteria = self._table('project_criteria')
+        selected_technique = self._table('selected_technique')
+        self.answers_changed([
+            (criteria_id, answer, None) for criteria_id, answer in self.db.session.execute(
+                select(project_criteria.c.criteria_id, project_criteria.c.answer)
+                .where(project_criteria.c.project_id == project_id)
+            )
+        ])
+        self.techniques_changed(removed=[
+            technique_name for (technique_name,) in self.db.session.execute(
+                select(selected_technique.c.technique_name).where(selected_technique.c.project_id == project_id)
+            )
+        ])
+
+    def criteria_removed(self, criteria_ids):
+        self.db.session.execute(delete(self.answer_counts).where(self.answer_counts.c.criteria_id.in_(criteria_ids)))
+
+    def summary(self):
+        session = self.db.session
+        criteria = self._table('criteria')
+        techniques = [
+            {'name': technique_name, 'projects': projects}
+            for technique_name, projects in session.execute(
+                select(self.technique_adoption.c.technique_name, self.technique_adoption.c.projects)
+                .order_by(self.technique_adoption.c.projects.desc(), self.technique_adoption.c.technique_name)
+            )
+        ]
+        answers = {}
+        for criteria_id, answer, projects in session.execute(
+            select(self.answer_counts.c.criteria_id, self.answer_counts.c.answer, self.answer_counts.c.projects)
+            .order_by(self.answer_counts.c.criteria_id, self.answer_counts.c.projects.desc(),
+                      self.answer_counts.c.answer)
+        ):
+            answers.setdefault(criteria_id, []).append({'answer': answer, 'projects': projects})
+        distributions = [
+            {'criterion': name, 'answers': answers.get(criteria_id, [])}
+            for criteria_id, name in session.execute(select(criteria.c.id, criteria.c.name).order_by(criteria.c.id))
+        ]
+        return {
+            'projects': session.execute(select(func.count()).select_from(self._table('project'))).scalar(),
+            'refreshed_at': self.refreshed_at(),
+            'techniques': techniques,
+            'reporting_areas': next(
+                (distribution['answers'] for distribution in distributions
+                 if distribution['criterion'] == 'reporting_area'), []
+            ),
+            'criteria': distributions,
+        }
+
+    def analytics_view(self):
+        if current_user.username not in current_app.config['ADMIN_USERNAMES']:
+            abort(403)
+        if self.refreshed_at() is None:
+            self.refresh()
+        summary = self.summary()
+        if request.args.get('format') == 'json':
+            return jsonify(summary)
+        return render_template('analytics.html', summary=summary)
@@ -0,0 +1,253 @@
+import json
+import zlib
+
+from flask import Blueprint, current_app, request
+
+from matching import MULTI_SELECT_CRITERIA, method_index, mismatch_message, profile_key
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Results per chunk of a streamed response; each chunk is flushed through the compressor
+STREAM_CHUNK_SIZE = 50
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_answers(answers, where, criteria_options):
+    # Criterion name -> answer, with multi-select answers given as a list or a comma
+    # separated string like the longlist stores them. Criteria and answers must be ones
+    # of the catalog (criteria_options, see matching.criteria_options()).
+    if not isinstance(answers, dict) or not answers:
+        raise APIError(f"{where}: 'answers' must be a non-empty object of criterion answers")
+    unknown = [criterion for criterion in answers if criterion not in criteria_options]
+    if unknown:
+        raise APIError(f"{where}: unknown criteria {', '.join(map(repr, unknown))}, "
+                       f"expected {', '.join(criteria_options)}")
+    parsed = {}
+    for criterion, answer in answers.items():
+        options = criteria_options[criterion]
+        if criterion in MULTI_SELECT_CRITERIA:
+            if isinstance(answer, str):
+                answer = answer.split(",")
+            if not isinstance(answer, list) or not all(isinstance(value, str) for value in answer):
+                raise APIError(f"{where}: '{criterion}' must be a list of strings")
+            unknown = [value for value in answer if value.strip() not in options]
+            if unknown:
+                raise APIError(f"{where}: unknown {criterion} {', '.join(map(repr, unknown))}")
+        elif not isinstance(answer, str):
+            raise APIError(f"{where}: '{criterion}' must be a string")
+        elif answer.strip() not in options:
+            raise APIError(f"{where}: '{criterion}' must be one of {', '.join(sorted(options))}")
+        parsed[criterion] = answer
+    return parsed
+
+
+def parse_profile(profile, where, criteria_options):
+    if not isinstance(profile, dict):
+        raise APIError(f"{where}: a profile must be an object")
+    selected = profile.get('selected', [])
+    if not isinstance(selected, list) or not all(isinstance(name, str) for name in selected):
+        raise APIError(f"{where}: 'selected' must be a list of method names")
+    return profile.get('id'), parse_answers(profile.get('answers'), where, criteria_options), selected
+
+
+class RecommendationsAPI:
+    # Versioned JSON API over the longlist matching, for systems that would otherwise
+    # scrape the longlist page:
+    #
+    #     POST /api/v1/recommendations
+    #     {"answers": {...}, "selected": [...]}            -> {"result": {...}}
+    #     {"profiles": [{"id": ..., "answers": {...}}, ...]} -> {"results": [...]}
+    #
+    # Each result lists the fitting, beyond capacity and non-fitting methods, the latter
+    # two with a record per failed criterion (unless "explain" is false):
+    # {"criterion", "kind", "accepted", "message"}, see matching.Mismatch.
+    # Batches are classified in one MethodIndex.classify_batch() call. With
+    # "Accept: application/x-ndjson" the results are streamed one per line instead.
+    # Responses are gzip or brotli compressed when the client accepts it.
+
+    def __init__(self, app=None, catalog=None, cache=None):
+        self.catalog = catalog
+        self.cache = cache
+        if app is not None:
+            self.init_app(app, catalog, cache)
+
+    def init_app(self, app, catalog, cache=None):
+        app.config.setdefault('API_MAX_PROFILES', 1000)
+        app.config.setdefault('API_COMPRESSION_MIN_SIZE', 1024)
+        self.catalog = catalog
+        self.cache = cache
+
+        blueprint = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+        blueprint.add_url_rule('/recommendations', 'recommendations', self.recommendations, methods=['POST'])
+        blueprint.register_error_handler(APIError, self.api_error)
+        app.register_blueprint(blueprint)
+
+    def api_error(self, error):
+        return self.json_response({'error': error.message}, error.status)
+
+    def method_summary(self, method):
+        summary = {'name': method['name']}
+        for key in MULTI_SELECT_CRITERIA:
+            if method.get(key):
+                summary[key] = method[key]
+        return summary
+
+    def mismatch_summary(self, mismatch):
+        return {
+            'criterion': mismatch.criterion,
+            'kind': mismatch.kind,
+            'accepted': list(mismatch.accepted),
+            'message': mismatch_message(mismatch),
+        }
+
+    def evaluate(self, index, profiles, explain):
+        # Results in the order of `profiles`. Identical profiles share their result, and
+        # each method and mismatch summary is built once for the whole batch.
+        summaries = {}
+        mismatch_summaries = {}
+        results_by_key = {}
+        criterion_masks = {}
+
+        def summarize(methods):
+            listed = []
+            for method in methods:
+                summary = summaries.get(method['name'])
+                if summary is None:
+                    summary = summaries[method['name']] = self.method_summary(method)
+                listed.append(summary)
+            return listed
+
+        def explained(project_answers, mask):
+            if not explain:
+                return summarize(index.methods_in(mask))
+            listed = []
+            for method, mismatches in index.mismatches(project_answers, mask, criterion_masks):
+                records = []
+                for mismatch in mismatches:
+                    record = mismatch_summaries.get(mismatch)
+                    if record is None:
+                        record = mismatch_summaries[mismatch] = self.mismatch_summary(mismatch)
+                    records.append(record)
+                listed.append(dict(summarize([method])[0], mismatches=records))
+            return listed
+
+        masks = index.classify_batch([answers for _, answers, _ in profiles], self.cache, criterion_masks)
+        for (profile_id, project_answers, selected), (fitting, beyond_capacity) in zip(profiles, masks):
+            key = profile_key(project_answers)
+            result = results_by_key.get(key)
+            if result is None:
+                result = results_by_key[key] = {
+                    'profile_key': key,
+                    'fitting': summarize(index.methods_in(fitting)),
+                    'beyond_capacity': explained(project_answers, beyond_capacity),
+                    'non_fitting': explained(project_answers, index.all_mask & ~fitting & ~beyond_capacity),
+                }
+            if profile_id is not None or selected:
+                result = dict(result)
+                if profile_id is not None:
+                    result = {'id': profile_id, **result}
+                if selected:
+                    result['non_fitting_selected'] = [
+                        method['name'] for method in index.methods_in(index.selected_mask(selected) & ~fitting)
+                    ]
+            yield result
+
+    def recommendations(self):
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise APIError("The request body must be a JSON object")
+        # Mismatches make up most of a large batch's response; "explain": false leaves them out
+        explain = body.get('explain', True)
+        if not isinstance(explain, bool):
+            raise APIError("'explain' must be true or false")
+        index = method_index(self.catalog)
+        if 'profiles' in body:
+            profiles = body['profiles']
+            if not isinstance(profiles, list) or not profiles:
+                raise APIError("'profiles' must be a non-empty list")
+            if len(profiles) > current_app.config['API_MAX_PROFILES']:
+                raise APIError(f"At most {current_app.config['API_MAX_PROFILES']} profiles per request", 413)
+            parsed = [
+                parse_profile(profile, f"profiles[{position}]", index.criteria_options)
+                for position, profile in enumerate(profiles)
+            ]
+        else:
+            parsed = [parse_profile(body, "request", index.criteria_options)]
+
+        results = self.evaluate(index, parsed, explain)
+
+        headers = {'X-Catalog-Version': str(index.version)}
+        if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            return self.ndjson_response(results, headers)
+        if 'profiles' in body:
+            payload = {'api_version': 1, 'catalog_version': index.version, 'results': list(results)}
+        else:
+            payload = {'api_version': 1, 'catalog_version': index.version, 'result': next(results)}
+        return self.json_response(payload, 200, headers)
+
+    def accepted_encoding(self):
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def json_response(self, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        response = current_app.response_class(body, status=status, headers=headers, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        encoding = self.accepted_encoding()
+        if encoding is not None and len(body) >= current_app.config['API_COMPRESSION_MIN_SIZE']:
+            response.set_data(brotli.compress(body, quality=5) if encoding == 'br' else gzip_compress(body))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def ndjson_response(self, results, headers):
+        def lines():
+            chunk = []
+            for result in results:
+                chunk.append(json.dumps(result, ensure_ascii=False, separators=(',', ':')))
+                if len(chunk) == STREAM_CHUNK_SIZE:
+                    yield ('\n'.join(chunk) + '\n').encode('utf-8')
+                    chunk = []
+            if chunk:
+                yield ('\n'.join(chunk) + '\n').encode('utf-8')
+
+        encoding = self.accepted_encoding()
+        body = lines() if encoding is None else compress_stream(lines(), encoding)
+        response = current_app.response_class(body, headers=headers, mimetype=NDJSON_MIMETYPE)
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    # Compress a streamed body, flushing after every chunk so that the client can
+    # decode each one as it arrives
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
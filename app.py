@@ -1,13 +1,52 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, Flask, render_template, redirect, url_for, flash, request, abort, session, make_response, current_app, g
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+from sqlalchemy import delete, event, insert, update
+from sqlalchemy.orm import selectinload
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import pandas as pd
-import json
-
-def check_missing_criteria_answers(project):
-    # Get all required criteria
-    required_criteria_ids = {c.id for c in Criteria.query.all()}
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+from analytics import PortfolioAnalytics
+from api import RecommendationsAPI
+from assets import Assets
+from caching import DiskCache, TTLCache
+from catalog import Catalog
+from config import Config
+from instrumentation import Instrumentation
+from matching import method_index, mismatch_message, profile_key
+from passwords import LoginThrottle, PasswordHasher, PasswordHasherBusy
+from rendering import FragmentCache, FragmentCacheExtension, is_not_modified, page_etag, template_version, with_etag
+from sessions import ServerSessions, regenerate_session
+from transfer import ProjectTransfer
+
+def get_required_criteria_ids():
+    # Read once per request, however many projects are checked
+    if 'required_criteria_ids' not in g:
+        g.required_criteria_ids = {criteria_id for (criteria_id,) in db.session.query(Criteria.id)}
+    return g.required_criteria_ids
+
+def current_criteria_schema():
+    if 'criteria_schema' not in g:
+        g.criteria_schema = db.session.get(CriteriaSchema, CRITERIA_SCHEMA_ID)
+    return g.criteria_schema
+
+def check_missing_criteria_answers(project, required_criteria_ids=None):
+    # A project stamped with the current criteria schema version answered every criterion.
+    # Once flag_stale_projects.py has restamped the complete projects for this version,
+    # any other stamp means new criteria are unanswered.
+    schema = current_criteria_schema()
+    if schema is not None and project.criteria_version is not None:
+        if project.criteria_version == schema.version:
+            return False
+        if schema.projects_checked:
+            return True
+
+    # Otherwise diff the answers. Get all required criteria, unless the caller already
+    # loaded them for several projects
+    if required_criteria_ids is None:
+        required_criteria_ids = get_required_criteria_ids()
 
     # Get all criteria ids that have been answered for the project
     answered_criteria_ids = {pc.criteria_id for pc in project.project_criteria}
@@ -16,14 +55,81 @@ def check_missing_criteria_answers(project):
     missing_criteria_ids = required_criteria_ids - answered_criteria_ids
     return len(missing_criteria_ids) > 0
 
-# Flask app initialization
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+def stamp_criteria_version(project):
+    # Stamp the current criteria schema version on a project that answered every criterion
+    schema = current_criteria_schema()
+    if schema is None:
+        return
+    answered_criteria_ids = {
+        criteria_id for (criteria_id,) in db.session.query(ProjectCriteria.criteria_id).filter_by(project_id=project.id)
+    }
+    project.criteria_version = schema.version if get_required_criteria_ids() <= answered_criteria_ids else None
+
+def get_project_answers(project):
+    # Project answers keyed by criterion name, with multi-select answers split into lists
+    return {
+        pc.criteria.name: pc.answer.split(",") if pc.criteria.name in ["reporting_area", "subsections"] else pc.answer
+        for pc in project.project_criteria
+    }
+
+# Extensions and process-wide state, bound to the app in create_app()
+db = SQLAlchemy()
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+main = Blueprint('main', __name__)
+
+# Server-side session store, used when SESSION_BACKEND isn't "cookie", see sessions.py
+server_sessions = ServerSessions(db)
+
+# Portfolio counts over all projects, kept in summary tables, see analytics.py
+analytics = PortfolioAnalytics(db)
+
+# Method catalog (reporting areas, methods, criteria descriptions), parsed once per worker
+catalog = Catalog()
+
+# Longlist classifications keyed by catalog version and canonical answer profile
+classification_cache = TTLCache()
+
+# Rendered longlist and intervention fragments, keyed by their inputs, see rendering.py
+fragment_cache = FragmentCache(TTLCache())
+
+# Optional process-wide cache of identities by session, to skip the user lookup entirely
+# (enabled by IDENTITY_CACHE_TTL)
+identity_cache = TTLCache()
+
+@catalog.on_reload
+def reset_classification_cache():
+    current_app.logger.info(f"Catalog reloaded, clearing longlist cache: {classification_cache.stats()}")
+    classification_cache.clear()
+    fragment_cache.clear()
+
+@main.app_context_processor
+def inject_catalog_digest():
+    # Keys cached fragments, which the disk tier shares across workers and restarts
+    return {'catalog_digest': catalog.digest}
+
+def sqlite_pragmas(busy_timeout_ms):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers in other gunicorn workers proceed while one of them writes
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            cursor.close()
+    return set_sqlite_pragmas
+
+# Length of the credential stamp in the session's user id, see credential_stamp()
+CREDENTIAL_STAMP_LENGTH = 16
+
+def credential_stamp(password_hash):
+    # Keyed digest of the password hash, stamped into the session's user id. Any new hash
+    # changes the stamp, which invalidates the sessions made with the old one, while
+    # the cookie reveals nothing about the hash itself.
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(key, password_hash.encode('utf-8'), hashlib.sha256).hexdigest()[:CREDENTIAL_STAMP_LENGTH]
 
 # User model
 class User(db.Model, UserMixin):
@@ -32,20 +138,54 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(60), nullable=False)
     projects = db.relationship('Project', backref='owner', lazy=True)
 
+    def get_id(self):
+        return f"{self.id}.{credential_stamp(self.password)}"
+
+# Slim stand-in for User on authenticated requests, without the relationships and hash
+class Identity(UserMixin):
+    def __init__(self, id, username, session_user_id):
+        self.id = id
+        self.username = username
+        self.session_user_id = session_user_id
+
+    def get_id(self):
+        return self.session_user_id
+
 # Project model
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    project_criteria = db.relationship('ProjectCriteria', backref='project', cascade="all, delete", lazy=True)
-    techniques = db.relationship('SelectedTechnique', backref='project', cascade="all, delete", lazy=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Criteria schema version the project last answered every criterion of, see
+    # check_missing_criteria_answers()
+    criteria_version = db.Column(db.Integer, nullable=True)
+    # Ordered by id so rows keep their insertion order when read through the unique indexes
+    project_criteria = db.relationship('ProjectCriteria', backref='project', cascade="all, delete", lazy=True,
+                                       order_by='ProjectCriteria.id')
+    techniques = db.relationship('SelectedTechnique', backref='project', cascade="all, delete", lazy=True,
+                                 order_by='SelectedTechnique.id')
 
 class Criteria(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     options=db.Column(db.String(500))
 
+# The one row of CriteriaSchema
+CRITERIA_SCHEMA_ID = 1
+
+# Version of the set of criteria, bumped by seed_data.py when criteria are added or removed
+class CriteriaSchema(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    # Digest of the criteria names the version was bumped for
+    digest = db.Column(db.String(40), nullable=False)
+    # Whether flag_stale_projects.py has restamped the projects for this version
+    projects_checked = db.Column(db.Boolean, nullable=False, default=False)
+
 class ProjectCriteria(db.Model):
+    __table_args__ = (
+        db.Index('uq_project_criteria_project_criteria', 'project_id', 'criteria_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
     criteria_id = db.Column(db.Integer, db.ForeignKey('criteria.id'), nullable=False)
@@ -55,6 +195,9 @@ class ProjectCriteria(db.Model):
 
 # SelectedTechnique model
 class SelectedTechnique(db.Model):
+    __table_args__ = (
+        db.Index('uq_selected_technique_project_technique', 'project_id', 'technique_name', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     technique_name = db.Column(db.String(100), nullable=False)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
@@ -62,58 +205,263 @@ class SelectedTechnique(db.Model):
     image_filename = db.Column(db.String(100), nullable=True)
 
 
+def dialect_insert():
+    # INSERT construct supporting ON CONFLICT for the current database, if there is one
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def lock_project(project):
+    # Lock the project row until the end of the transaction, so concurrent submissions
+    # for one project take turns and each diffs against the rows the other wrote. SQLite
+    # has no row locks, but it fails a write based on a read another writer overtook.
+    if db.session.get_bind().dialect.name != 'sqlite':
+        db.session.query(Project.id).filter_by(id=project.id).with_for_update().one()
+
+
+def save_criteria_answers(project, answers):
+    # Diff the submitted answers (criteria id -> answer) against the stored ones and
+    # write only the changes, as one batched statement
+    lock_project(project)
+    existing = {
+        criteria_id: (answer_id, answer)
+        for answer_id, criteria_id, answer in db.session.query(
+            ProjectCriteria.id, ProjectCriteria.criteria_id, ProjectCriteria.answer
+        ).filter_by(project_id=project.id)
+    }
+    changed = [
+        {"project_id": project.id, "criteria_id": criteria_id, "answer": answer}
+        for criteria_id, answer in answers.items()
+        if criteria_id not in existing or existing[criteria_id][1] != answer
+    ]
+    if not changed:
+        return
+
+    upsert = dialect_insert()
+    if upsert is not None:
+        # Upsert on the unique (project_id, criteria_id) index, so two concurrent
+        # submissions for the same project can't create duplicate answers. Only the rows
+        # actually inserted or changed are returned.
+        statement = upsert(ProjectCriteria).values(changed)
+        written = set(db.session.execute(statement.on_conflict_do_update(
+            index_elements=["project_id", "criteria_id"],
+            set_={"answer": statement.excluded.answer},
+            where=ProjectCriteria.answer.is_distinct_from(statement.excluded.answer),
+        ).returning(ProjectCriteria.criteria_id)).scalars())
+    else:
+        updates = [
+            {"id": existing[row["criteria_id"]][0], "answer": row["answer"]}
+            for row in changed if row["criteria_id"] in existing
+        ]
+        inserts = [row for row in changed if row["criteria_id"] not in existing]
+        if updates:
+            db.session.execute(update(ProjectCriteria), updates)
+        if inserts:
+            db.session.execute(insert(ProjectCriteria), inserts)
+        written = {row["criteria_id"] for row in changed}
+
+    analytics.answers_changed([
+        (row["criteria_id"], existing[row["criteria_id"]][1] if row["criteria_id"] in existing else None, row["answer"])
+        for row in changed if row["criteria_id"] in written
+    ])
+
+
+def delete_selected_techniques(project, technique_names):
+    # Delete the project's selections of these techniques, returning the names of the
+    # ones that were still there
+    statement = delete(SelectedTechnique).where(
+        SelectedTechnique.project_id == project.id,
+        SelectedTechnique.technique_name.in_(technique_names),
+    )
+    if db.session.get_bind().dialect.delete_returning:
+        return db.session.execute(statement.returning(SelectedTechnique.technique_name)).scalars().all()
+    db.session.execute(statement)
+    return list(technique_names)
+
+
+def save_selected_techniques(project, method_names, methods_by_name):
+    # Diff the submitted technique selection against the stored one, inserting the
+    # newly selected catalog methods and deleting the deselected ones in bulk
+    lock_project(project)
+    existing = {
+        technique_name for (technique_name,) in db.session.query(
+            SelectedTechnique.technique_name
+        ).filter_by(project_id=project.id)
+    }
+    inserts = [
+        {
+            "technique_name": methods_by_name[method_name]["name"],
+            "description": methods_by_name[method_name]["description"],
+            "image_filename": methods_by_name[method_name].get("photo"),
+            "project_id": project.id,
+        }
+        for method_name in dict.fromkeys(method_names)
+        if method_name not in existing and method_name in methods_by_name
+    ]
+    removed = existing - set(method_names)
+
+    added = []
+    if inserts:
+        upsert = dialect_insert()
+        if upsert is not None:
+            # Rows another submission inserted first are skipped, and not returned
+            added = db.session.execute(upsert(SelectedTechnique).values(inserts).on_conflict_do_nothing(
+                index_elements=["project_id", "technique_name"],
+            ).returning(SelectedTechnique.technique_name)).scalars().all()
+        else:
+            db.session.execute(insert(SelectedTechnique), inserts)
+            added = [row["technique_name"] for row in inserts]
+    if removed:
+        removed = delete_selected_techniques(project, removed)
+    analytics.techniques_changed(added, removed)
+
+
+# Content-hashed, precompressed and resized static assets (see build_assets.py)
+assets = Assets()
+
+# Opt-in request metrics and slow request profiling
+instrumentation = Instrumentation()
+
+# JSON API over the longlist matching, for other systems
+recommendations_api = RecommendationsAPI()
+
+# Bulk project export and import (NDJSON/CSV), see also transfer_projects.py
+project_transfer = ProjectTransfer(db, catalog, User, Project, Criteria, ProjectCriteria, SelectedTechnique)
+
+@project_transfer.on_import
+def count_imported_projects(answers, techniques):
+    analytics.answers_changed([(answer["criteria_id"], None, answer["answer"]) for answer in answers])
+    analytics.techniques_changed([technique["technique_name"] for technique in techniques])
+
+@instrumentation.add_gauge_source
+def cache_gauges():
+    catalog_stats = catalog.stats()
+    cache_stats = classification_cache.stats()
+    fragment_stats = fragment_cache.stats()
+    return {
+        'app_catalog_version': catalog_stats['version'],
+        'app_catalog_compiled': int(catalog_stats['compiled']),
+        'app_catalog_loads_total': catalog_stats['loads'],
+        'app_catalog_reloads_total': catalog_stats['reloads'],
+        'app_catalog_load_seconds_total': catalog_stats['load_seconds_total'],
+        'app_longlist_cache_hits_total': cache_stats['hits'],
+        'app_longlist_cache_misses_total': cache_stats['misses'],
+        'app_longlist_cache_evictions_total': cache_stats['evictions'],
+        'app_longlist_cache_size': cache_stats['size'],
+        'app_fragment_cache_hits_total': fragment_stats['hits'],
+        'app_fragment_cache_misses_total': fragment_stats['misses'],
+        'app_fragment_cache_size': fragment_stats['size'],
+    }
+
+
+def set_password(user, password):
+    user.password = password_hasher.generate_password_hash(password)
+    # The user's other sessions are now invalid, drop any identity cached for them
+    identity_cache.clear()
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-@app.route("/")
+    # Flask-Login keeps the result for the rest of the request as current_user
+    id_part, _, stamp = user_id.partition('.')
+    if not id_part.isdigit() or not stamp:
+        return None
+
+    cache_key = (session.get('sid'), user_id)
+    use_cache = bool(current_app.config['IDENTITY_CACHE_TTL'] and cache_key[0])
+    if use_cache:
+        identity = identity_cache.get(cache_key)
+        if identity is not None:
+            return identity
+
+    row = db.session.query(User.id, User.username, User.password).filter(User.id == int(id_part)).first()
+    if row is None or not hmac.compare_digest(credential_stamp(row.password), stamp):
+        return None
+
+    identity = Identity(row.id, row.username, user_id)
+    if use_cache:
+        identity_cache.set(cache_key, identity)
+    return identity
+
+@main.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    # Raised by login and register when too many password hashes are queued
+    flash('The server is busy. Please try again in a moment.', 'danger')
+    return render_template(f'{request.endpoint.rpartition(".")[2]}.html'), 503, {'Retry-After': '1'}
+
+@main.route("/")
 def landing():
     return render_template("landing.html")
 
-@app.route("/login", methods=['GET', 'POST'])
+@main.route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('account'))
+        return redirect(url_for('main.account'))
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
+        if not login_throttle.allowed(username):
+            flash('Too many failed login attempts. Please try again later.', 'danger')
+            return render_template('login.html'), 429
         user = User.query.filter_by(username=username).first()
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and password_hasher.check_password_hash(user.password, password):
+            login_throttle.reset(username)
+            if password_hasher.needs_rehash(user.password):
+                # Stored with another cost factor than the configured one
+                set_password(user, password)
+                db.session.commit()
+            regenerate_session()
             login_user(user)
-            return redirect(url_for('account'))
+            session['sid'] = secrets.token_urlsafe(16)
+            return redirect(url_for('main.account'))
         else:
+            login_throttle.record_failure(username)
             flash('Login Unsuccessful. Please check username and password', 'danger')
     return render_template('login.html')
 
 
-@app.route("/register", methods=['GET', 'POST'])
+@main.route("/register", methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('account'))
+        return redirect(url_for('main.account'))
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         if not password:
             flash('Password cannot be empty', 'danger')
-            return redirect(url_for('register'))
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+            return redirect(url_for('main.register'))
+        hashed_password = password_hasher.generate_password_hash(password)
         user = User(username=username, password=hashed_password)
         db.session.add(user)
         db.session.commit()
         flash('Your account has been created! You can now log in', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html')
 
 
 # Account page route
-@app.route("/account")
+@main.route("/account")
 @login_required
 def account():
-    projects = Project.query.filter_by(user_id=current_user.id).all()
+    # Load the projects with their answers and techniques up front, so rendering the
+    # dashboard takes a fixed number of queries regardless of the number of projects
+    projects = (
+        Project.query.filter_by(user_id=current_user.id)
+        .options(
+            selectinload(Project.project_criteria).selectinload(ProjectCriteria.criteria),
+            selectinload(Project.techniques),
+        )
+        .all()
+    )
     for project in projects:
         if check_missing_criteria_answers(project):
             flash("One of your projects requires updated criteria answers. Please answer the new questions.", "warning")
-            return redirect(url_for('questions', project_id=project.id))
+            return redirect(url_for('main.questions', project_id=project.id))
 
     project_details = []
     for project in projects:
@@ -131,7 +479,7 @@ def account():
 
 
 # Unified create and edit project route
-@app.route("/questions", methods=["GET", "POST"])
+@main.route("/questions", methods=["GET", "POST"])
 @login_required
 def questions():
     project_id = request.args.get('project_id')
@@ -147,18 +495,18 @@ def questions():
         for criterion in Criteria.query.all()
     ]
 
-    # Load subsections from reporting_area.json
-    with open('static/data/reporting_area.json', 'r') as json_file:
-        reporting_areas = json.load(json_file)["reporting_areas"]
+    reporting_areas = catalog.reporting_areas
+    criteria_descriptions = catalog.criteria_descriptions
 
     if request.method == "POST":
         errors = []
 
         if not project:
             project_name = request.form.get("project_name")
-            project = Project(name=project_name, owner=current_user)
+            project = Project(name=project_name, user_id=current_user.id)
             db.session.add(project)
-            db.session.commit()
+            # Only flush, so the project and its answers are saved in one transaction
+            db.session.flush()
 
         # Save or update criteria answers
         selected_areas = request.form.getlist("criteria_reporting_area")
@@ -176,6 +524,7 @@ def questions():
                     errors.append(f"Please select at least one subsection for '{area['name']}'.")
 
         if errors:
+            db.session.commit()
             for error in errors:
                 flash(error, "danger")  # Ensure "danger" matches the template's CSS class
             return render_template(
@@ -183,17 +532,13 @@ def questions():
                 project=project,
                 criteria=criteria,
                 reporting_areas=reporting_areas,
-                project_criteria_answers={
-                    pc.criteria.name: pc.answer.split(",")
-                    if pc.criteria.name in ["reporting_area", "subsections"]
-                    else pc.answer
-                    for pc in project.project_criteria
-                }
-                if project
-                else {},
+                project_criteria_answers=get_project_answers(project) if project else {},
+                criteria_descriptions=criteria_descriptions,
             )
 
         # Save or update criteria answers
+        previous_answers = get_project_answers(project)
+        answers = {}
         for criterion in criteria:
             if criterion["name"] == "reporting_area":
                 selected_areas = request.form.getlist(f"criteria_{criterion['name']}")
@@ -205,29 +550,19 @@ def questions():
                 answer = request.form.get(f"criteria_{criterion['name']}")
 
             if answer:
-                project_criteria = ProjectCriteria.query.filter_by(
-                    project_id=project.id, criteria_id=criterion["id"]
-                ).first()
-
-                if project_criteria:
-                    project_criteria.answer = answer
-                else:
-                    new_project_criteria = ProjectCriteria(
-                        project_id=project.id, criteria_id=criterion["id"], answer=answer
-                    )
-                    db.session.add(new_project_criteria)
+                answers[criterion["id"]] = answer
 
+        save_criteria_answers(project, answers)
+        stamp_criteria_version(project)
         db.session.commit()
-        return redirect(url_for("longlist", project_id=project.id))
 
-    # Prepare existing answers for display
-    project_criteria_answers = {
-        pc.criteria.name: pc.answer.split(",") if pc.criteria.name in ["reporting_area", "subsections"] else pc.answer
-        for pc in project.project_criteria
-    } if project else {}
+        # Drop the memoized longlist of the answers this project no longer has
+        if previous_answers and get_project_answers(project) != previous_answers:
+            classification_cache.pop((catalog.version, profile_key(previous_answers)))
+        return redirect(url_for("main.longlist", project_id=project.id))
 
-    with open('static/data/criteria_descriptions.json', 'r') as json_file:
-        criteria_descriptions = json.load(json_file)
+    # Prepare existing answers for display
+    project_criteria_answers = get_project_answers(project) if project else {}
 
     return render_template(
         "questions.html",
@@ -239,112 +574,25 @@ def questions():
     )
 
 
-@app.route("/longlist/<int:project_id>", methods=["GET", "POST"])
+@main.route("/longlist/<int:project_id>", methods=["GET", "POST"])
 @login_required
 def longlist(project_id):
     project = Project.query.get_or_404(project_id)
 
-    # Load the reporting area methods from the JSON file
-    with open("static/data/reporting_area.json", "r") as json_file:
-        reporting_areas = json.load(json_file)["reporting_areas"]
-
-    # Load the always applicable methods from the separate JSON file
-    with open("static/data/methods.json", "r") as json_file:
-        always_applicable_methods = json.load(json_file)["methods"]
-
     # Check for missing criteria
     if check_missing_criteria_answers(project):
         flash("Additional criteria have been added. Please answer the new questions before proceeding.", "warning")
-        return redirect(url_for("questions", project_id=project.id))
+        return redirect(url_for("main.questions", project_id=project.id))
 
     # Fetch project answers dynamically from ProjectCriteria
-    project_answers = {
-        pc.criteria.name: pc.answer.split(",") if pc.criteria.name in ["reporting_area", "subsections"] else pc.answer
-        for pc in project.project_criteria
-    }
+    project_answers = get_project_answers(project)
 
-    # Collect all methods from reporting areas
-    reporting_area_methods = []
-    for reporting_area in reporting_areas:
-        for subsection in reporting_area.get("subsections", []):
-            for method in subsection.get("methods", []):
-                if "name" in method:
-                    # Add reporting area and subsection information to the method
-                    reporting_area_methods.append({
-                        "reporting_area": reporting_area["name"],
-                        "subsections": subsection["name"],
-                        **method
-                    })
-                else:
-                    app.logger.warning(
-                        f"Method in subsection '{subsection['name']}' is missing a 'name' key and will be skipped."
-                    )
-
-    # Combine reporting area methods and always applicable methods
-    all_methods = reporting_area_methods + always_applicable_methods
-
-    # Define a function to determine if a method fits the project's answers
-    def method_fits(method, project_answers):
-        for criterion, answer in project_answers.items():
-            field = method.get(criterion)
-            # Handle reporting_area and subsections
-            if criterion in ["reporting_area", "subsections"]:
-                if field and field not in answer:
-                    return False
-            elif field and "levels" in field:
-                # Check other criteria (budget, skills, etc.)
-                if answer not in field["levels"]:
-                    return False
-        return True
-
-    # Define a function to check if a method is "beyond capacity"
-    def method_beyond_capacity(method, project_answers):
-        # Priority mapping for levels
-        LEVEL_PRIORITY = {"Low": 1, "Medium": 2, "High": 3}
-
-        for criterion, answer in project_answers.items():
-            # Skip phase_of_project as it does not have hierarchical levels
-            if criterion == "phase_of_project":
-                continue
-
-            field = method.get(criterion)
-            if field and "levels" in field:
-                levels = field["levels"]
-
-                # Filter levels to those present in LEVEL_PRIORITY
-                valid_levels = [LEVEL_PRIORITY[level] for level in levels if level in LEVEL_PRIORITY]
-
-                # Handle empty or invalid levels gracefully
-                if not valid_levels:
-                    app.logger.warning(
-                        f"Levels for method '{method['name']}' in criterion '{criterion}' are invalid or empty.")
-                    continue
-
-                # Get the maximum priority of the method's levels
-                max_method_priority = max(valid_levels)
-
-                # Get the user's selected priority
-                user_priority = LEVEL_PRIORITY.get(answer, 0)
-
-                # If the user's priority exceeds the method's max, it is beyond capacity
-                if user_priority > max_method_priority:
-                    return True
-        return False
-
-    # Pre-index methods by name for faster lookups
-    methods_by_name = {method["name"]: method for method in all_methods}
-
-    # Categorize methods
-    fitting_methods = [method for method in all_methods if method_fits(method, project_answers)]
-    beyond_capacity_methods = [
-        method for method in all_methods
-        if method not in fitting_methods and method_beyond_capacity(method, project_answers)
-    ]
+    # Categorize methods against the compiled catalog index
+    index = method_index(catalog)
+    methods_by_name = index.methods_by_name
     selected_methods = [t.technique_name for t in project.techniques]
-    non_fitting_selected_methods = [
-        method for method in all_methods
-        if method["name"] in selected_methods and not method_fits(method, project_answers)
-    ]
+    masks = index.classify_masks(project_answers, selected_methods, cache=classification_cache)
+    fitting_methods, beyond_capacity_methods, non_fitting_selected_methods = (index.methods_in(mask) for mask in masks)
 
     if request.method == "POST":
         newly_selected_methods = request.form.getlist("technique")
@@ -367,49 +615,16 @@ def longlist(project_id):
                 project=project,
             )
 
-        # Add new selections
-        for method_name in newly_selected_methods:
-            if not SelectedTechnique.query.filter_by(project_id=project.id, technique_name=method_name).first():
-                selected_method = methods_by_name.get(method_name)
-                if selected_method:
-                    new_selection = SelectedTechnique(
-                        technique_name=selected_method["name"],
-                        description=selected_method["description"],
-                        image_filename=selected_method.get("photo"),
-                        project_id=project.id,
-                    )
-                    db.session.add(new_selection)
-
-        # Remove deselected methods
-        for technique in project.techniques:
-            if technique.technique_name not in newly_selected_methods:
-                db.session.delete(technique)
-
+        # Add new selections and remove deselected methods
+        save_selected_techniques(project, newly_selected_methods, methods_by_name)
         db.session.commit()
-        return redirect(url_for("project", project_id=project.id))
+        return redirect(url_for("main.project", project_id=project.id))
 
     # Prepare reasons for non-fitting methods
-    reasons = {}
-    for method in non_fitting_selected_methods:
-        reason = []
-        for criterion, answer in project_answers.items():
-            field = method.get(criterion)
-            if criterion == "reporting_area" or criterion == "subsections":
-                if field not in answer:
-                    print(field)
-                    reason.append(
-                        f"A Your selected {criterion.replace('_', ' ')} is '{answer}', "
-                        f"but this method is suitable for {(field)}."
-                    )
-            else:
-                if answer not in field["levels"]:
-                    print("ongoing2")
-                    reason.append(
-                        f"B Your selected {criterion.replace('_', ' ')} is '{answer}', "
-                        f"but this method is suitable for {', '.join(field['levels'])}."
-                    )
-
-        reasons[method["name"]] = " ".join(reason)
+    reasons = {
+        method["name"]: " ".join(mismatch_message(mismatch) for mismatch in mismatches)
+        for method, mismatches in index.mismatches(project_answers, masks[2])
+    }
 
     return render_template(
         "longlist.html",
@@ -425,7 +640,7 @@ def longlist(project_id):
 
 
 
-@app.route("/project/<int:project_id>", methods=['GET'])
+@main.route("/project/<int:project_id>", methods=['GET'])
 @login_required
 def project(project_id):
     project = Project.query.get_or_404(project_id)
@@ -433,77 +648,147 @@ def project(project_id):
     # Check for missing criteria answers
     if check_missing_criteria_answers(project):
         flash("Additional criteria have been added. Please answer the new questions before proceeding.", "warning")
-        return redirect(url_for('questions', project_id=project.id))
+        return redirect(url_for('main.questions', project_id=project.id))
 
     # Fetch project criteria answers
     criteria_answers = {pc.criteria.name: pc.answer for pc in project.project_criteria}
 
     # Retrieve selected techniques for the project
-    techniques = SelectedTechnique.query.filter_by(project_id=project.id).all()
+    techniques = SelectedTechnique.query.filter_by(project_id=project.id).order_by(SelectedTechnique.id).all()
 
     if not techniques:
-        app.logger.warning(f"No techniques found for project ID {project_id}.")
+        current_app.logger.warning(f"No techniques found for project ID {project_id}.")
 
-    return render_template(
+    # The page only changes with the project's answers and techniques, so a browser
+    # revalidating an unchanged page gets an empty 304
+    etag = page_etag(
+        fragment_cache.version, current_user.id, project.id, project.name, criteria_answers,
+        [(t.technique_name, t.description, t.image_filename) for t in techniques],
+    )
+    if is_not_modified(etag):
+        return with_etag(current_app.response_class(status=304), etag)
+
+    return with_etag(make_response(render_template(
         'project.html',
         project=project,
         techniques=techniques,
         criteria_answers=criteria_answers
-    )
+    )), etag)
 
 
 
 
-@app.route("/logout")
+@main.route("/logout")
 @login_required
 def logout():
+    identity_cache.pop((session.get('sid'), current_user.get_id()))
+    session.pop('sid', None)
     logout_user()
+    regenerate_session()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('landing'))
+    return redirect(url_for('main.landing'))
 
 
-@app.route("/delete_project/<int:project_id>", methods=['POST'])
+@main.route("/delete_project/<int:project_id>", methods=['POST'])
 @login_required
 def delete_project(project_id):
     project = Project.query.get_or_404(project_id)
-    if project.owner != current_user:
+    if project.user_id != current_user.id:
         abort(403)
+    analytics.project_removed(project.id)
     db.session.delete(project)
     db.session.commit()
     flash('Your project has been deleted!', 'success')
-    return redirect(url_for('account'))
+    return redirect(url_for('main.account'))
 
 
-@app.route("/project/<int:project_id>/technique/<string:technique_name>")
+@main.route("/project/<int:project_id>/technique/<string:technique_name>")
 @login_required
 def intervention(project_id, technique_name):
     project = Project.query.get_or_404(project_id)
 
-
-    with open('static/data/reporting_area.json', 'r') as json_file:
-        reporting_areas = json.load(json_file)
     # Assuming that techniques are directly related to the project
     technique = next((tech for tech in project.techniques if tech.technique_name == technique_name), None)
     if technique is None:
         abort(404)  # Technique not found in the project
+    _, catalog_data = catalog.snapshot()
+    etag = page_etag(
+        fragment_cache.version, catalog_data['digest'], current_user.id, project.id, project.name,
+        technique.technique_name, technique.description, technique.image_filename,
+    )
+    if is_not_modified(etag):
+        return with_etag(current_app.response_class(status=304), etag)
     # Pass both `project` and `technique` to the template
-    return render_template("intervention.html", project=project, technique=technique,
-                           reporting_areas=reporting_areas)
+    return with_etag(make_response(render_template("intervention.html", project=project, technique=technique,
+                                                   reporting_areas=catalog_data['reporting_areas'])), etag)
 
-@app.route("/project/<int:project_id>/technique/<string:technique_name>/remove", methods=['POST'])
+@main.route("/project/<int:project_id>/technique/<string:technique_name>/remove", methods=['POST'])
 @login_required
 def remove_technique(project_id, technique_name):
     project = Project.query.get_or_404(project_id)
     technique = next((tech for tech in project.techniques if tech.technique_name == technique_name), None)
 
     if technique:
-        db.session.delete(technique)
+        analytics.techniques_changed(removed=delete_selected_techniques(project, [technique.technique_name]))
         db.session.commit()
         flash(f"Technique '{technique_name}' has been removed from the project.", "warning")
     else:
         flash(f"Technique '{technique_name}' not found in the project.", "danger")
 
-    return redirect(url_for('project', project_id=project.id))
+    return redirect(url_for('main.project', project_id=project.id))
+
+def create_app(config=Config):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if not app.config['SECRET_KEY']:
+        if not (app.debug or app.testing):
+            raise ValueError("SECRET_KEY must be set outside debug and testing mode")
+        # Sessions don't outlive the process
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+    db.init_app(app)
+    server_sessions.init_app(app)
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
+    login_manager.init_app(app)
+    with app.app_context():
+        event.listen(db.engine, "connect", sqlite_pragmas(app.config['SQLITE_BUSY_TIMEOUT_MS']))
+
+    classification_cache.configure(maxsize=app.config['LONGLIST_CACHE_SIZE'], ttl=app.config['LONGLIST_CACHE_TTL'])
+    identity_cache.configure(maxsize=app.config['IDENTITY_CACHE_SIZE'], ttl=app.config['IDENTITY_CACHE_TTL'])
+    fragment_cache.memory.configure(maxsize=app.config['FRAGMENT_CACHE_SIZE'], ttl=app.config['FRAGMENT_CACHE_TTL'])
+    if app.config['FRAGMENT_CACHE_DIR']:
+        fragment_cache.disk = DiskCache(app.config['FRAGMENT_CACHE_DIR'], ttl=app.config['FRAGMENT_CACHE_TTL'],
+                                        maxsize=app.config['FRAGMENT_CACHE_DIR_SIZE'])
+    fragment_cache.version = template_version(app)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragment_cache
+
+    assets.init_app(app)
+    instrumentation.init_app(app, db, catalog)
+    recommendations_api.init_app(app, catalog, classification_cache)
+    project_transfer.init_app(app)
+    analytics.init_app(app)
+    app.register_blueprint(main)
+    return app
+
+
+def warm_up(app):
+    # Load everything requests only read: the catalog, its method index for every
+    # criterion and the compiled templates. Run in the gunicorn master before forking
+    # (see gunicorn.conf.py), the workers share these pages instead of each building them.
+    with app.app_context():
+        catalog.refresh()
+        index = method_index(catalog)
+        for name in index.criteria_options:
+            index.criterion(name)
+        for template in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(template)
+        db.session.remove()
+        # Connections must not be shared with the forked workers
+        db.engine.dispose()
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Debug mode from the start, so that create_app() runs without a SECRET_KEY
+    os.environ.setdefault('FLASK_DEBUG', '1')
+    create_app().run(debug=True)
@@ -0,0 +1,129 @@
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Output of build_assets.py, served under /assets with far-future cache headers
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+MANIFEST_PATH = os.path.join(BUILD_DIR, 'manifest.json')
+
+# Content-hashed files never change, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Precompressed variants written next to text assets, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+class Assets:
+    # Template helpers and serving for the assets built by build_assets.py. Without a
+    # build (e.g. in development) the helpers fall back to the original static files.
+
+    def __init__(self, app=None):
+        self.manifest = {'images': {}, 'files': {}}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.load_manifest()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.wsgi_app = self.public_vary(app.wsgi_app, '/assets/')
+        app.jinja_env.globals.update(
+            asset_url=self.asset_url,
+            responsive_image=self.responsive_image,
+            background_image=self.background_image,
+        )
+
+    def load_manifest(self):
+        if os.path.exists(MANIFEST_PATH):
+            with open(MANIFEST_PATH, 'r') as manifest_file:
+                self.manifest = json.load(manifest_file)
+        # Precompressed encodings by built path, for serving
+        self.encodings = {built['path']: built.get('encodings', []) for built in self.manifest['files'].values()}
+
+    def asset_url(self, filename):
+        built = self.manifest['files'].get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=built['path'])
+
+    def _srcset(self, variants):
+        return ', '.join(f"{url_for('assets', filename=path)} {width}w" for width, path in variants)
+
+    def responsive_image(self, filename, alt='', sizes='100vw', **attributes):
+        # <picture> with AVIF and WebP sources and a fallback <img>, each with a srcset
+        image = self.manifest['images'].get(filename)
+        extra = ''.join(
+            f' {escape(name.rstrip("_"))}="{escape(value)}"' for name, value in attributes.items()
+        )
+        if image is None:
+            return Markup(f'<img src="{escape(url_for("static", filename=filename))}" alt="{escape(alt)}"{extra}>')
+
+        fallback = image['variants'][image['fallback_format']]
+        sources = ''.join(
+            f'<source type="{MIME_TYPES[image_format]}" srcset="{escape(self._srcset(variants))}" sizes="{escape(sizes)}">'
+            for image_format, variants in image['variants'].items()
+            if image_format != image['fallback_format']
+        )
+        return Markup(
+            f'<picture>{sources}'
+            f'<img src="{escape(url_for("assets", filename=fallback[-1][1]))}" '
+            f'srcset="{escape(self._srcset(fallback))}" sizes="{escape(sizes)}" '
+            f'width="{image["width"]}" height="{image["height"]}" alt="{escape(alt)}"{extra}>'
+            f'</picture>'
+        )
+
+    def background_image(self, filename):
+        # CSS background-image declarations: the largest fallback for older browsers,
+        # then an image-set() letting newer ones pick AVIF or WebP
+        image = self.manifest['images'].get(filename)
+        if image is None:
+            return Markup(f"background-image: url('{escape(url_for('static', filename=filename))}');")
+        fallback = url_for('assets', filename=image['variants'][image['fallback_format']][-1][1])
+        candidates = ', '.join(
+            f'url("{url_for("assets", filename=variants[-1][1])}") type("{MIME_TYPES[image_format]}")'
+            for image_format, variants in image['variants'].items()
+        )
+        return Markup(f"background-image: url('{fallback}'); background-image: image-set({candidates});")
+
+    def serve(self, filename):
+        # Serve a precompressed variant when the client accepts it and one was built
+        encodings = self.encodings.get(filename, [])
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                response = send_from_directory(BUILD_DIR, filename + suffix, max_age=31536000)
+                response.headers['Content-Encoding'] = encoding
+                response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                break
+        else:
+            response = send_from_directory(BUILD_DIR, filename, max_age=31536000)
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    @staticmethod
+    def public_vary(wsgi_app, prefix):
+        # Asset responses are the same for every user, but Flask adds "Vary: Cookie" after
+        # the view whenever a request touched the session (as Flask-Login does on every
+        # request), which keeps shared caches and CDNs from storing them. Only
+        # Accept-Encoding is kept.
+        def middleware(environ, start_response):
+            if not environ.get('PATH_INFO', '').startswith(prefix):
+                return wsgi_app(environ, start_response)
+
+            def start_public_response(status, headers, exc_info=None):
+                varies = [value.lower() for name, value in headers if name.lower() == 'vary']
+                headers = [(name, value) for name, value in headers if name.lower() != 'vary']
+                if any('accept-encoding' in value for value in varies):
+                    headers.append(('Vary', 'Accept-Encoding'))
+                return start_response(status, headers, exc_info)
+
+            return wsgi_app(environ, start_public_response)
+
+        return middleware
@@ -0,0 +1,132 @@
+# Session backend benchmark: request cookie size and latency of a flash-heavy flow with
+# the signed cookie session and with the server-side stores (see sessions.py).
+#
+#     python -m benchmarks.sessions --users 20 --flashes 8 --output sessions.json
+#
+# Every virtual user registers, logs in, creates a project, then triggers --flashes
+# flash-and-redirect requests without following the redirects (as a script or an
+# impatient user does), so the messages pile up in the session until the project page
+# shows them. The in-process app is created once per backend on its own database.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.workflow import ROOT, answers_form, git_revision, percentile, random_answers
+
+BACKENDS = ("cookie", "sql", "filesystem")
+
+
+def run_backend(backend, args, criteria, reporting_areas, temp_dir):
+    import random
+
+    import seed_data
+    from app import create_app, db
+    from config import Config
+
+    class BenchmarkConfig(Config):
+        SECRET_KEY = "benchmark"
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(temp_dir, f"{backend}.db")
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        SESSION_BACKEND = backend
+        SESSION_FILE_DIR = os.path.join(temp_dir, f"{backend}-sessions")
+        BCRYPT_LOG_ROUNDS = 4
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        seed_data.seed_criteria()
+
+    rnd = random.Random(args.seed)
+    cookie_bytes = []
+    samples = defaultdict(list)
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+
+    def timed(client, route, method, path, data=None):
+        cookie = client.get_cookie(cookie_name)
+        cookie_bytes.append(len(cookie_name) + 1 + len(cookie.value) if cookie is not None else 0)
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        samples[route].append(time.perf_counter() - started)
+        return response
+
+    for user_number in range(args.users):
+        client = app.test_client()
+        credentials = {"username": f"bench-{backend}-{user_number}", "password": "benchmark-password"}
+        timed(client, "register", "POST", "/register", credentials)
+        timed(client, "login", "POST", "/login", credentials)
+        response = timed(client, "questions POST", "POST", "/questions",
+                         dict(answers_form(random_answers(rnd, criteria, reporting_areas)),
+                              project_name=f"Project {user_number}"))
+        project_id = response.headers["Location"].rsplit("/", 1)[-1]
+        for flash_number in range(args.flashes):
+            timed(client, "remove technique", "POST",
+                  f"/project/{project_id}/technique/Missing technique {flash_number}/remove")
+        timed(client, "project", "GET", f"/project/{project_id}")
+        for _ in range(args.reads):
+            timed(client, "account", "GET", "/account")
+
+    every_sample = [sample for route_samples in samples.values() for sample in route_samples]
+    return {
+        "requests": len(every_sample),
+        "request_cookie_bytes_mean": statistics.fmean(cookie_bytes),
+        "request_cookie_bytes_max": max(cookie_bytes),
+        "mean_ms": statistics.fmean(every_sample) * 1000,
+        "p50_ms": percentile(every_sample, 50) * 1000,
+        "p95_ms": percentile(every_sample, 95) * 1000,
+        "routes": {
+            route: {
+                "requests": len(route_samples),
+                "mean_ms": statistics.fmean(route_samples) * 1000,
+                "p95_ms": percentile(route_samples, 95) * 1000,
+            }
+            for route, route_samples in samples.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the cookie and server-side session backends.")
+    parser.add_argument("--users", type=int, default=20, help="virtual users per backend")
+    parser.add_argument("--flashes", type=int, default=8, help="flash messages each user piles up")
+    parser.add_argument("--reads", type=int, default=10, help="account page views after the flashes")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--seed", type=int, default=1, help="random seed for answers")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    with open(os.path.join(ROOT, "static", "data", "criteria.json")) as criteria_file:
+        criteria = json.load(criteria_file)
+    with open(os.path.join(ROOT, "static", "data", "reporting_area.json")) as reporting_area_file:
+        reporting_areas = json.load(reporting_area_file)["reporting_areas"]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # The app module reads its default database URL at import time
+        os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(temp_dir, "unused.db"))
+        results = {backend: run_backend(backend, args, criteria, reporting_areas, temp_dir)
+                   for backend in args.backends}
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "backends": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
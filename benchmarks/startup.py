@@ -0,0 +1,177 @@
+# Startup benchmark: import time and resident memory of a fresh worker process that
+# imports and creates the app and serves its first request, the work every gunicorn
+# worker repeats without preload_app.
+#
+#     python -m benchmarks.startup --runs 5 --output startup.json
+# Fails (exit status 1) when the medians regress beyond the committed baseline, or when
+# a module that only offline build steps need (pandas, openpyxl, ...) is imported:
+#     python -m benchmarks.startup --check
+# After an intended change, record new medians with --update-baseline. tests/test_startup.py
+# runs the check with the test suite.
+#
+# Absolute times and sizes depend on the machine, so the checked metrics are relative to
+# a reference process measured alongside each sample, one that only imports the app's
+# dependencies: the import time as a multiple of the reference's, and the memory on top
+# of the reference's. The default tolerance (25%) leaves room for run to run noise and
+# for other Python and library versions; the baseline was recorded on Python 3.11.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.workflow import ROOT, git_revision
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+
+# Only used by build_assets.py and import_techniques.py, never by a worker
+FORBIDDEN_MODULES = ("pandas", "numpy", "openpyxl", "PIL")
+
+# Runs in the child process; prints one JSON sample
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+application = create_app()
+import_seconds = time.perf_counter() - started
+
+def rss_kb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+rss_after_import = rss_kb()
+started = time.perf_counter()
+application.test_client().get("/")
+first_request_seconds = time.perf_counter() - started
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "first_request_seconds": first_request_seconds,
+    "rss_after_import_mb": rss_after_import / 1024,
+    "rss_after_request_mb": rss_kb() / 1024,
+    "forbidden_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (FORBIDDEN_MODULES,)
+
+# Runs in the reference child process: the third-party packages the app imports
+REFERENCE_MODULES = ("flask", "flask_sqlalchemy", "flask_login", "sqlalchemy", "bcrypt")
+
+REFERENCE_PROBE = """
+import json, time
+started = time.perf_counter()
+%s
+import_seconds = time.perf_counter() - started
+with open("/proc/self/status") as status:
+    rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+print(json.dumps({"import_seconds": import_seconds, "rss_mb": rss_kb / 1024}))
+""" % "\n".join(f"import {name}" for name in REFERENCE_MODULES)
+
+METRICS = (
+    "import_seconds", "first_request_seconds", "rss_after_import_mb", "rss_after_request_mb",
+    "import_ratio", "app_rss_mb",
+)
+
+# Metrics compared against the baseline, both relative to the reference process
+CHECKED_METRICS = ("import_ratio", "app_rss_mb")
+
+
+def run_probe(probe, env):
+    output = subprocess.check_output([sys.executable, "-c", probe], cwd=ROOT, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONDONTWRITEBYTECODE="1")
+    env.setdefault("SECRET_KEY", "benchmark")
+    reference = run_probe(REFERENCE_PROBE, env)
+    sample = run_probe(PROBE, env)
+    sample["import_ratio"] = sample["import_seconds"] / reference["import_seconds"]
+    sample["app_rss_mb"] = sample["rss_after_request_mb"] - reference["rss_mb"]
+    return sample
+
+
+def summarize(samples):
+    summary = {}
+    for metric in METRICS:
+        values = [sample[metric] for sample in samples]
+        summary[metric] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def check(summary, samples, baseline, tolerance):
+    failures = []
+    forbidden = sorted({name for sample in samples for name in sample["forbidden_modules"]})
+    if forbidden:
+        failures.append(f"worker imports build-only modules: {', '.join(forbidden)}")
+    for metric in CHECKED_METRICS:
+        if metric not in baseline:
+            continue
+        limit = baseline[metric] * (1 + tolerance)
+        median = summary[metric]["median"]
+        if median > limit:
+            failures.append(f"{metric} median {median:.3f} exceeds baseline {baseline[metric]:.3f} "
+                            f"by more than {tolerance:.0%}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark worker startup time and memory.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to measure")
+    parser.add_argument("--check", action="store_true", help="fail if the medians regress beyond the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, as a fraction")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline medians to check against")
+    parser.add_argument("--update-baseline", action="store_true", help="write the medians to the baseline")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_url = "sqlite:///" + os.path.join(temp_dir, "startup.db")
+        samples = [measure(database_url) for _ in range(args.runs)]
+    summary = summarize(samples)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "metrics": summary,
+        "forbidden_modules": sorted({name for sample in samples for name in sample["forbidden_modules"]}),
+    }
+
+    failures = []
+    if args.check:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        else:
+            baseline = {}
+        failures = check(summary, samples, baseline, args.tolerance)
+        report["failures"] = failures
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({metric: round(summary[metric]["median"], 3) for metric in CHECKED_METRICS},
+                      baseline_file, indent=2)
+            baseline_file.write("\n")
+    if failures:
+        for failure in failures:
+            print(f"Startup regression: {failure}", file=sys.stderr)
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
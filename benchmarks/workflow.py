@@ -0,0 +1,289 @@
+# Load benchmark of the full project workflow:
+# register -> login -> questions POST -> longlist GET/POST -> project -> intervention -> account
+#
+# In-process, against a temporary SQLite database seeded with synthetic data:
+#     python -m benchmarks.workflow --users 20 --seed-users 50 --output bench.json
+# Against a running server (e.g. gunicorn), SQL query counts are not available:
+#     python -m benchmarks.workflow --url http://127.0.0.1:8000 --users 20 --concurrency 4
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TECHNIQUE_INPUT = re.compile(r'name="technique"\s+value="([^"]+)"')
+LONGLIST_LOCATION = re.compile(r'/longlist/(\d+)')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def random_answers(rnd, criteria, reporting_areas):
+    # Answers that pass questions() validation: every selected area gets a subsection.
+    # Levels lean towards Low so that the longlist usually has fitting methods.
+    areas = rnd.sample(reporting_areas, rnd.randint(1, 2))
+    subsections = [rnd.choice(area["subsections"])["name"] for area in areas if area.get("subsections")]
+    answers = {
+        "reporting_area": [area["name"] for area in areas],
+        "subsections": subsections,
+    }
+    for criterion in criteria:
+        if criterion["name"] not in answers:
+            options = [option.strip() for option in criterion["options"].split(",")]
+            answers[criterion["name"]] = options[0] if rnd.random() < 0.7 else rnd.choice(options)
+    return answers
+
+
+def answers_form(answers):
+    return {f"criteria_{name}": value for name, value in answers.items()}
+
+
+class LocalClient:
+    # Flask test client counting the SQL statements each request issues
+
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, data=None):
+        self.counter.reset()
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get("Location", ""), response.get_data(as_text=True), self.counter.count
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    # Cookie-keeping HTTP client for a running server; redirects are not followed,
+    # matching the Flask test client
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.headers.get("Location", ""), response.read().decode(), None
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get("Location", ""), error.read().decode(), None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def timed(self, client, route, method, path, data=None, expect=(200, 302)):
+        started = time.perf_counter()
+        status, location, body, queries = client.request(method, path, data)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples[route].append(elapsed)
+            if queries is not None:
+                self.queries[route].append(queries)
+            if status not in expect:
+                self.errors[route] += 1
+        return status, location, body
+
+    def report(self, wall_seconds):
+        routes = {}
+        for route, samples in self.samples.items():
+            queries = self.queries.get(route)
+            routes[route] = {
+                "requests": len(samples),
+                "errors": self.errors.get(route, 0),
+                "mean_ms": statistics.fmean(samples) * 1000,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "requests_per_second": len(samples) / sum(samples),
+                "sql_queries_mean": statistics.fmean(queries) if queries else None,
+                "sql_queries_max": max(queries) if queries else None,
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "total_requests": total,
+            "wall_seconds": wall_seconds,
+            "requests_per_second": total / wall_seconds if wall_seconds else None,
+            "routes": routes,
+        }
+
+
+def run_user_flow(client, recorder, user_number, run_id, criteria, reporting_areas, rnd):
+    username = f"bench-{run_id}-{user_number}"
+    credentials = {"username": username, "password": "benchmark-password"}
+    recorder.timed(client, "register", "POST", "/register", credentials)
+    recorder.timed(client, "login", "POST", "/login", credentials)
+
+    answers = random_answers(rnd, criteria, reporting_areas)
+    status, location, _ = recorder.timed(
+        client, "questions POST", "POST", "/questions",
+        dict(answers_form(answers), project_name=f"Project {user_number}"),
+    )
+    match = LONGLIST_LOCATION.search(location)
+    if not match:
+        return
+    project_id = match.group(1)
+
+    _, _, body = recorder.timed(client, "longlist GET", "GET", f"/longlist/{project_id}")
+    fitting = TECHNIQUE_INPUT.findall(body)
+    selected = rnd.sample(fitting, min(len(fitting), 3))
+    recorder.timed(client, "longlist POST", "POST", f"/longlist/{project_id}", {"technique": selected})
+    recorder.timed(client, "project", "GET", f"/project/{project_id}")
+    for technique in selected:
+        recorder.timed(client, "intervention", "GET",
+                       f"/project/{project_id}/technique/{urllib.parse.quote(technique)}")
+    recorder.timed(client, "account", "GET", "/account")
+
+
+def seed_synthetic_data(app, db, users, projects_per_user, criteria, reporting_areas, rnd):
+    # Synthetic users, projects and answers, inserted the way seed_data.py seeds criteria
+    from app import Criteria, Project, ProjectCriteria, User, password_hasher
+
+    password = password_hasher.generate_password_hash("benchmark-password")
+    criteria_ids = {criterion.name: criterion.id for criterion in Criteria.query.all()}
+    for user_number in range(users):
+        user = User(username=f"seed-{user_number}", password=password)
+        db.session.add(user)
+        for project_number in range(projects_per_user):
+            project = Project(name=f"Seeded project {project_number}", owner=user)
+            db.session.add(project)
+            for name, answer in random_answers(rnd, criteria, reporting_areas).items():
+                db.session.add(ProjectCriteria(
+                    project=project,
+                    criteria_id=criteria_ids[name],
+                    answer=",".join(answer) if isinstance(answer, list) else answer,
+                ))
+    db.session.commit()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the project workflow end to end.")
+    parser.add_argument("--users", type=int, default=20, help="virtual users walking through the workflow")
+    parser.add_argument("--seed-users", type=int, default=20, help="synthetic users seeded before the run")
+    parser.add_argument("--seed-projects", type=int, default=5, help="projects per seeded user")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel virtual users (with --url)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for answers and selections")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    rnd = random.Random(args.seed)
+    run_id = f"{int(time.time())}-{os.getpid()}"
+    with open(os.path.join(ROOT, "static", "data", "criteria.json")) as criteria_file:
+        criteria = json.load(criteria_file)
+    with open(os.path.join(ROOT, "static", "data", "reporting_area.json")) as reporting_area_file:
+        reporting_areas = json.load(reporting_area_file)["reporting_areas"]
+
+    recorder = Recorder()
+    temp_dir = None
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+        concurrency = args.concurrency
+    else:
+        # The app reads its database URL at import time
+        temp_dir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(temp_dir.name, "benchmark.db")
+        os.environ.setdefault("SECRET_KEY", "benchmark")
+        from sqlalchemy import event
+
+        import seed_data
+        from app import create_app, db
+
+        app = create_app()
+
+        counter = QueryCounter()
+        with app.app_context():
+            db.create_all()
+            seed_data.seed_criteria()
+            seed_synthetic_data(app, db, args.seed_users, args.seed_projects, criteria, reporting_areas, rnd)
+            event.listen(db.engine, "before_cursor_execute", counter)
+
+        def make_client():
+            return LocalClient(app, counter)
+        # The query counter is shared, so in-process runs are sequential
+        concurrency = 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_user_flow, make_client(), recorder, user_number, run_id,
+                        criteria, reporting_areas, random.Random(rnd.random()))
+            for user_number in range(args.users)
+        ]
+        for future in futures:
+            future.result()
+    wall_seconds = time.perf_counter() - started
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.url or "in-process",
+        "parameters": vars(args),
+        **recorder.report(wall_seconds),
+    }
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Offline asset build: resized AVIF/WebP/JPEG-or-PNG variants of the large images,
+# content-hashed copies of the stylesheet and logos, and gzip/brotli versions of the
+# stylesheet. Writes everything plus manifest.json to static/build, read by assets.py.
+#
+#     python build_assets.py
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+
+from PIL import Image
+
+from assets import BUILD_DIR, MANIFEST_PATH, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Images served with responsive variants, relative to static/
+RESPONSIVE_IMAGES = ['images/*.png', 'images/*.jpg', 'images/*.jpeg']
+# Files copied under a content-hashed name only
+HASHED_FILES = ['styles.css', 'images/logo/*.png']
+# Text files that also get precompressed variants
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+
+WIDTHS = (480, 960, 1600)
+MAX_WIDTH = 1920
+QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+
+
+def hashed_name(source, content, suffix=''):
+    stem, extension = os.path.splitext(source)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"{stem}{suffix}.{digest}{extension}"
+
+
+def write(path, content):
+    full_path = os.path.join(BUILD_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as output:
+        output.write(content)
+
+
+def has_transparency(image):
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA').getextrema()[3][0] < 255
+    return False
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    options = {'quality': QUALITY[image_format]} if image_format in QUALITY else {'optimize': True}
+    if image_format == 'jpeg':
+        image = image.convert('RGB')
+        options.update(optimize=True, progressive=True)
+    image.save(buffer, format=image_format.upper(), **options)
+    return buffer.getvalue()
+
+
+def build_image(source):
+    image = Image.open(os.path.join(STATIC_DIR, source))
+    image.load()
+    fallback_format = 'png' if has_transparency(image) else 'jpeg'
+    if fallback_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # Never upscale; the largest variant is the original width, capped at MAX_WIDTH
+    largest = min(image.width, MAX_WIDTH)
+    widths = sorted({width for width in WIDTHS if width < largest} | {largest})
+
+    variants = {'avif': [], 'webp': [], fallback_format: []}
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for image_format in variants:
+            content = encode(resized, image_format)
+            stem, _ = os.path.splitext(source)
+            path = hashed_name(f"{stem}.{'jpg' if image_format == 'jpeg' else image_format}", content, f"-{width}")
+            write(path, content)
+            variants[image_format].append([width, path])
+    return {
+        'width': largest,
+        'height': round(image.height * largest / image.width),
+        'fallback_format': fallback_format,
+        'variants': variants,
+    }
+
+
+def build_file(source):
+    with open(os.path.join(STATIC_DIR, source), 'rb') as source_file:
+        content = source_file.read()
+    path = hashed_name(source, content)
+    write(path, content)
+    encodings = []
+    if source.endswith(COMPRESSIBLE_EXTENSIONS):
+        write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        encodings.append('gzip')
+        if brotli is not None:
+            write(path + '.br', brotli.compress(content, quality=11))
+            encodings.append('br')
+    return {'path': path, 'encodings': encodings}
+
+
+def expand(patterns):
+    sources = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(STATIC_DIR, pattern))):
+            sources.append(os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'))
+    return sources
+
+
+def build_assets():
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    manifest = {'images': {}, 'files': {}}
+    for source in expand(RESPONSIVE_IMAGES):
+        manifest['images'][source] = build_image(source)
+        print(f"Built {source}")
+    for source in expand(HASHED_FILES):
+        manifest['files'][source] = build_file(source)
+        print(f"Built {source}")
+    write(os.path.relpath(MANIFEST_PATH, BUILD_DIR), json.dumps(manifest, indent=2).encode('utf-8'))
+    if brotli is None:
+        print("Brotli is not installed, only gzip variants were written.")
+
+
+if __name__ == '__main__':
+    build_assets()
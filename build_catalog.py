@@ -0,0 +1,36 @@
+# Offline catalog build: compiles reporting_area.json, methods.json and techniques.json
+# (see import_techniques.py) into static/data/catalog.bin, which catalog.py memory-maps
+# instead of parsing the JSON. Rerun it whenever those files change; until then the
+# app falls back to the JSON.
+#
+#     python build_catalog.py
+import argparse
+import os
+import tempfile
+
+from catalog import COMPILED_FILENAME, DATA_DIR
+from compiled_catalog import CompiledCatalog, compile_catalog
+
+
+def build_catalog(data_dir=DATA_DIR, output=None):
+    output = output or os.path.join(data_dir, COMPILED_FILENAME)
+    content = compile_catalog(data_dir)
+    # Replace the file instead of rewriting it, since running workers have it mapped
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)))
+    with os.fdopen(handle, 'wb') as output_file:
+        output_file.write(content)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, output)
+
+    compiled = CompiledCatalog(output)
+    print(f"Wrote {output}: {len(content)} bytes, {len(compiled.indexed_methods())} methods, "
+          f"{len(compiled.criteria)} level criteria, {len(compiled.techniques())} techniques")
+    compiled.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the method catalog into its binary form.")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="directory with the catalog source files")
+    parser.add_argument('--output', help=f"output file, {COMPILED_FILENAME} in the data directory by default")
+    args = parser.parse_args()
+    build_catalog(args.data_dir, args.output)
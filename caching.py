@@ -0,0 +1,158 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire `ttl` seconds after being set.
+    # A ttl of None keeps entries until they are evicted.
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def configure(self, maxsize, ttl):
+        # Resize the cache once its settings are known, evicting what no longer fits
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self._stats['misses'] += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def pop(self, key):
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self._stats['invalidations'] += 1
+                return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), maxsize=self.maxsize, ttl=self.ttl)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class DiskCache:
+    # String values stored as files in `directory`, so that every worker process on
+    # the machine shares them. Entries older than `ttl` seconds are treated as missing.
+    # At most every `sweep_interval` seconds a write also sweeps the directory, removing
+    # expired entries and then the oldest ones beyond `maxsize`.
+
+    def __init__(self, directory, ttl=None, maxsize=None, sweep_interval=60):
+        self.directory = directory
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and os.path.getmtime(path) + self.ttl <= time.time():
+                os.remove(path)
+                return default
+            with open(path, 'r', encoding='utf-8') as entry:
+                return entry.read()
+        except OSError:
+            return default
+
+    def set(self, key, value):
+        # Write to a temporary file first so readers never see a partial entry
+        path = self._path(key)
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(handle, 'w', encoding='utf-8') as entry:
+            entry.write(value)
+        os.replace(temp_path, path)
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        if time.monotonic() < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            self.sweep()
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self):
+        now = time.time()
+        entries = []
+        with os.scandir(self.directory) as directory:
+            for entry in directory:
+                # Temporary files still being written start with a dot
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    modified = entry.stat().st_mtime
+                    if self.ttl is not None and modified + self.ttl <= now:
+                        os.remove(entry.path)
+                    else:
+                        entries.append((modified, entry.path))
+                except OSError:
+                    pass
+        if self.maxsize is not None and len(entries) > self.maxsize:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.maxsize]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.'):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from compiled_catalog import SOURCE_FILES, CatalogFormatError, CompiledCatalog, freeze, source_digest
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'data')
+
+# Data files making up the method catalog, keyed by the attribute they are exposed under
+CATALOG_FILES = {
+    'reporting_areas': 'reporting_area.json',
+    'methods': 'methods.json',
+    'criteria_descriptions': 'criteria_descriptions.json',
+    # The criteria and their options, also seeded into the database by seed_data.py
+    'criteria': 'criteria.json',
+}
+
+# Output of build_catalog.py, used instead of reporting_area.json and methods.json
+# while it is up to date with them
+COMPILED_FILENAME = 'catalog.bin'
+
+
+class Catalog:
+    # Method catalog parsed once per worker process. The data files are stat'ed at
+    # most every `check_interval` seconds and reloaded when their mtime or size changes.
+    # A compiled catalog next to them is memory-mapped instead of parsing the JSON.
+
+    def __init__(self, data_dir=DATA_DIR, check_interval=2.0):
+        self.data_dir = data_dir
+        self.compiled_path = os.path.join(data_dir, COMPILED_FILENAME)
+        self.check_interval = check_interval
+        self.version = 0
+        self._lock = threading.Lock()
+        self._data = {}
+        self._signature = None
+        self._next_check = 0.0
+        self._reload_listeners = []
+        self._stats = {
+            'loads': 0,
+            'reloads': 0,
+            'failed_reloads': 0,
+            'checks': 0,
+            'load_seconds_total': 0.0,
+            'last_load_seconds': 0.0,
+            'last_loaded_at': None,
+            'compiled': False,
+        }
+
+    def _path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def _file_signature(self):
+        signature = []
+        for filename in CATALOG_FILES.values():
+            stat = os.stat(self._path(filename))
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        # The other compiled sources and the compiled catalog itself are optional
+        for filename in (*SOURCE_FILES, COMPILED_FILENAME):
+            if filename not in CATALOG_FILES.values() and os.path.exists(self._path(filename)):
+                stat = os.stat(self._path(filename))
+                signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _open_compiled(self):
+        # The compiled catalog, unless it is missing, unreadable or built from other sources
+        if not os.path.exists(self.compiled_path):
+            return None
+        try:
+            compiled = CompiledCatalog(self.compiled_path)
+        except (OSError, CatalogFormatError):
+            logger.exception("Can't read the compiled catalog, loading the JSON files instead")
+            return None
+        if compiled.source_digest != source_digest(self.data_dir):
+            logger.warning("The compiled catalog is out of date, run build_catalog.py; loading the JSON files instead")
+            compiled.close()
+            return None
+        return compiled
+
+    def _load(self, signature):
+        started = time.perf_counter()
+        data = {}
+        digest = hashlib.sha1()
+        compiled = self._open_compiled()
+        if compiled is not None:
+            data['reporting_areas'] = compiled.reporting_areas()
+            data['methods'] = compiled.always_applicable_methods()
+            data['compiled'] = compiled
+            digest.update(compiled.source_digest)
+        for key, filename in CATALOG_FILES.items():
+            if key not in data:
+                with open(self._path(filename), 'rb') as json_file:
+                    source = json_file.read()
+                data[key] = json.loads(source)
+                digest.update(filename.encode('utf-8'))
+                digest.update(source)
+        if compiled is None:
+            data['reporting_areas'] = data['reporting_areas']['reporting_areas']
+            data['methods'] = data['methods']['methods']
+        self._data = {key: freeze(value) for key, value in data.items()}
+        self._data['digest'] = digest.hexdigest()
+        self._signature = signature
+        self.version += 1
+
+        elapsed = time.perf_counter() - started
+        self._stats['loads'] += 1
+        if self.version > 1:
+            self._stats['reloads'] += 1
+        self._stats['load_seconds_total'] += elapsed
+        self._stats['last_load_seconds'] = elapsed
+        self._stats['last_loaded_at'] = time.time()
+        self._stats['compiled'] = compiled is not None
+
+        if self.version > 1:
+            for listener in self._reload_listeners:
+                listener()
+
+    def refresh(self, force=False):
+        # Reload the catalog if any data file changed since the last load
+        now = time.monotonic()
+        if not force and self._signature is not None and now < self._next_check:
+            return False
+        with self._lock:
+            if not force and self._signature is not None and now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            self._stats['checks'] += 1
+            signature = self._file_signature()
+            if force or signature != self._signature:
+                try:
+                    self._load(signature)
+                except ValueError:
+                    # A data file is being rewritten or is malformed; keep serving the
+                    # previous catalog and try again on the next check
+                    if not self._data:
+                        raise
+                    self._stats['failed_reloads'] += 1
+                    logger.exception("Reloading the method catalog failed, keeping version %s", self.version)
+                    return False
+                logger.info("Loaded method catalog version %s in %.1f ms",
+                            self.version, self._stats['last_load_seconds'] * 1000)
+                return True
+        return False
+
+    def on_reload(self, listener):
+        # Register a callable invoked after the catalog is reloaded from changed files
+        self._reload_listeners.append(listener)
+        return listener
+
+    def _get(self, key):
+        self.refresh()
+        return self._data[key]
+
+    @property
+    def reporting_areas(self):
+        return self._get('reporting_areas')
+
+    @property
+    def methods(self):
+        return self._get('methods')
+
+    @property
+    def criteria_descriptions(self):
+        return self._get('criteria_descriptions')
+
+    @property
+    def criteria(self):
+        return self._get('criteria')
+
+    @property
+    def digest(self):
+        # Digest of the catalog's content. Unlike the version, which counts reloads in
+        # this process, it is the same in every process serving the same files.
+        return self._get('digest')
+
+    def snapshot(self):
+        # Version and data of the current catalog, read together so callers deriving
+        # structures from several files never mix two versions
+        self.refresh()
+        with self._lock:
+            return self.version, self._data
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, version=self.version)
@@ -0,0 +1,467 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Compiled form of the method catalog, written by build_catalog.py and memory-mapped by
+# catalog.py. Every string is stored once in a pool and referenced by id; methods are
+# fixed-size records in flattened order, with each level criterion stored as a bitmask
+# over that criterion's level vocabulary. All integers are little-endian uint32.
+#
+#     header     magic, format version, section count, techniques columns list id, source digest
+#     sections   (offset, count) for each section below, in SECTIONS order
+#     strings    count + 1 offsets into the UTF-8 blob that follows them
+#     list_items string ids of all string lists, back to back
+#     lists      count + 1 start indices into list_items
+#     criteria   (name, level vocabulary list) per level criterion
+#     methods    METHOD_STRING_FIELDS, METHOD_LIST_FIELDS, extras, flags, then
+#                (has levels, level mask, levels list, extra_information) per criterion
+#     areas      (name, description, first subsection, subsection count, extras)
+#     subsections (name, description, first method, method count, extras)
+#                with a count of NONE when the source has no subsections/methods key
+#     techniques one string id per column and row of techniques.json
+#
+# Values that don't fit a column (e.g. a null description, or a key only some methods
+# have) are kept in the record's extras, a JSON object in the string pool.
+
+MAGIC = b'AMFCATLG'
+FORMAT_VERSION = 1
+
+# Files compiled into the artifact; their digest is stored so stale builds are detected
+SOURCE_FILES = ('reporting_area.json', 'methods.json', 'techniques.json')
+
+SECTIONS = ('strings', 'list_items', 'lists', 'criteria', 'methods', 'areas', 'subsections', 'techniques')
+
+METHOD_STRING_FIELDS = ('name', 'reporting_area', 'subsections', 'description', 'photo')
+METHOD_LIST_FIELDS = ('pros', 'cons', 'parameters_measured')
+# Keys flatten_methods() adds to every method of a reporting area
+RESERVED_METHOD_KEYS = ('reporting_area', 'subsections')
+
+# Method flags
+INDEXED = 1  # part of the flattened method list the longlist classifies
+ALWAYS_APPLICABLE = 2  # from methods.json rather than a reporting area
+
+# Marks a missing string, list or extras reference
+NONE = 0xFFFFFFFF
+
+HEADER = struct.Struct('<8sHHI20s')
+SECTION = struct.Struct('<II')
+UINT32 = struct.Struct('<I')
+CRITERION = struct.Struct('<II')
+AREA = struct.Struct('<IIIII')
+CRITERION_COLUMNS = 4
+
+
+class CatalogFormatError(ValueError):
+    pass
+
+
+class CatalogCompileError(ValueError):
+    pass
+
+
+def freeze(value):
+    # Recursively turn parsed JSON into read-only mappings and tuples so the
+    # shared catalog can't be mutated by one request and leak into the next
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def method_struct(criteria_count):
+    columns = len(METHOD_STRING_FIELDS) + len(METHOD_LIST_FIELDS) + 2 + CRITERION_COLUMNS * criteria_count
+    return struct.Struct(f'<{columns}I')
+
+
+def source_digest(data_dir):
+    digest = hashlib.sha1()
+    for filename in SOURCE_FILES:
+        digest.update(filename.encode('utf-8'))
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+        else:
+            digest.update(b'\0missing')
+    return digest.digest()
+
+
+def is_level_field(value):
+    # The {"levels": [...], "extra_information": ...} shape of level criteria
+    return (
+        isinstance(value, dict)
+        and list(value) == ['levels', 'extra_information']
+        and isinstance(value['levels'], list)
+        and all(isinstance(level, str) for level in value['levels'])
+        and (value['extra_information'] is None or isinstance(value['extra_information'], str))
+    )
+
+
+class CatalogCompiler:
+    # Builds the compiled catalog from the parsed source files
+
+    def __init__(self, reporting_areas, always_applicable_methods, techniques=None):
+        self.reporting_areas = reporting_areas
+        self.always_applicable_methods = always_applicable_methods
+        self.techniques = techniques or {'columns': [], 'rows': []}
+        self.strings = {}
+        self.lists = {}
+        self.criteria = self._criteria_vocabularies()
+
+    def _criteria_vocabularies(self):
+        # Level values of every level criterion, in order of first appearance
+        vocabularies = {}
+        for method in self._all_methods():
+            for key, value in method.items():
+                if is_level_field(value):
+                    vocabulary = vocabularies.setdefault(key, [])
+                    for level in value['levels']:
+                        if level not in vocabulary:
+                            vocabulary.append(level)
+        for name, vocabulary in vocabularies.items():
+            if len(vocabulary) > 32:
+                raise CatalogCompileError(f"Criterion '{name}' has {len(vocabulary)} levels, at most 32 fit a mask")
+        return vocabularies
+
+    def _all_methods(self):
+        for reporting_area in self.reporting_areas:
+            for subsection in reporting_area.get('subsections', []):
+                yield from subsection.get('methods', [])
+        yield from self.always_applicable_methods
+
+    def string(self, value):
+        if value is None:
+            return NONE
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = self.strings[value] = len(self.strings)
+        return sid
+
+    def string_list(self, values):
+        key = tuple(self.string(value) for value in values)
+        list_id = self.lists.get(key)
+        if list_id is None:
+            list_id = self.lists[key] = len(self.lists)
+        return list_id
+
+    def take_string(self, fields, key):
+        # Move a string value out of `fields` into a column; anything else stays an extra
+        if isinstance(fields.get(key), str):
+            return self.string(fields.pop(key))
+        return NONE
+
+    def take_list(self, fields, key):
+        value = fields.get(key)
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return self.string_list(fields.pop(key))
+        return NONE
+
+    def extras(self, fields):
+        return self.string(json.dumps(fields, ensure_ascii=False)) if fields else NONE
+
+    def method_row(self, method, reporting_area=None, subsection=None):
+        fields = dict(method)
+        for key in RESERVED_METHOD_KEYS:
+            if key in fields:
+                raise CatalogCompileError(f"Method '{fields.get('name')}' must not define '{key}'")
+        flags = INDEXED
+        if reporting_area is None:
+            flags |= ALWAYS_APPLICABLE
+        elif 'name' not in fields:
+            # flatten_methods() skips these; warn once at build time instead
+            flags = 0
+            logger.warning(f"Method in subsection '{subsection}' is missing a 'name' key and will be skipped.")
+
+        row = [
+            self.take_string(fields, 'name'),
+            self.string(reporting_area),
+            self.string(subsection),
+            self.take_string(fields, 'description'),
+            self.take_string(fields, 'photo'),
+        ]
+        row.extend(self.take_list(fields, key) for key in METHOD_LIST_FIELDS)
+        criteria = []
+        for name, vocabulary in self.criteria.items():
+            value = fields.get(name)
+            if is_level_field(value):
+                del fields[name]
+                mask = 0
+                for level in value['levels']:
+                    mask |= 1 << vocabulary.index(level)
+                criteria.extend((1, mask, self.string_list(value['levels']), self.string(value['extra_information'])))
+            else:
+                criteria.extend((0, 0, NONE, NONE))
+        row.extend((self.extras(fields), flags))
+        row.extend(criteria)
+        return row
+
+    def section_rows(self):
+        methods, areas, subsections = [], [], []
+        for reporting_area in self.reporting_areas:
+            area_fields = dict(reporting_area)
+            area_subsections = area_fields.pop('subsections', None)
+            area_row = [self.take_string(area_fields, 'name'), self.take_string(area_fields, 'description'),
+                        len(subsections), NONE if area_subsections is None else len(area_subsections)]
+            for subsection in area_subsections or []:
+                subsection_fields = dict(subsection)
+                subsection_methods = subsection_fields.pop('methods', None)
+                subsection_row = [self.take_string(subsection_fields, 'name'),
+                                  self.take_string(subsection_fields, 'description'),
+                                  len(methods), NONE if subsection_methods is None else len(subsection_methods)]
+                methods.extend(self.method_row(method, reporting_area['name'], subsection['name'])
+                               for method in subsection_methods or [])
+                subsections.append(subsection_row + [self.extras(subsection_fields)])
+            areas.append(area_row + [self.extras(area_fields)])
+        methods.extend(self.method_row(method) for method in self.always_applicable_methods)
+
+        techniques = [
+            [self.string(None if value is None else str(value)) for value in row]
+            for row in self.techniques['rows']
+        ]
+        return methods, areas, subsections, techniques
+
+    def compile(self, digest):
+        methods, areas, subsections, techniques = self.section_rows()
+        criteria = [(self.string(name), self.string_list(vocabulary)) for name, vocabulary in self.criteria.items()]
+        techniques_columns = self.string_list(self.techniques['columns'])
+
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        list_items, list_starts = [], [0]
+        for items in self.lists:
+            list_items.extend(items)
+            list_starts.append(len(list_items))
+        method_row = method_struct(len(criteria))
+        technique_row = struct.Struct(f'<{len(self.techniques["columns"])}I')
+
+        sections = {
+            'strings': (len(encoded), pack_uints(offsets) + b''.join(encoded)),
+            'list_items': (len(list_items), pack_uints(list_items)),
+            'lists': (len(self.lists), pack_uints(list_starts)),
+            'criteria': (len(criteria), b''.join(CRITERION.pack(*row) for row in criteria)),
+            'methods': (len(methods), b''.join(method_row.pack(*row) for row in methods)),
+            'areas': (len(areas), b''.join(AREA.pack(*row) for row in areas)),
+            'subsections': (len(subsections), b''.join(AREA.pack(*row) for row in subsections)),
+            'techniques': (len(techniques), b''.join(technique_row.pack(*row) for row in techniques)),
+        }
+
+        output = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS), techniques_columns, digest))
+        table_offset = len(output)
+        output.extend(bytes(SECTION.size * len(SECTIONS)))
+        for position, name in enumerate(SECTIONS):
+            count, content = sections[name]
+            # Keep every section 8-byte aligned
+            output.extend(bytes(-len(output) % 8))
+            SECTION.pack_into(output, table_offset + position * SECTION.size, len(output), count)
+            output.extend(content)
+        return bytes(output)
+
+
+def pack_uints(values):
+    return struct.pack(f'<{len(values)}I', *values)
+
+
+def read_techniques(path):
+    # Rows of techniques.json (written by import_techniques.py), with the union of
+    # their keys as the columns
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as json_file:
+        techniques = json.load(json_file)['techniques']
+    columns = list(dict.fromkeys(key for technique in techniques for key in technique))
+    return {'columns': columns, 'rows': [[technique.get(column) for column in columns] for technique in techniques]}
+
+
+def compile_catalog(data_dir):
+    with open(os.path.join(data_dir, 'reporting_area.json'), 'r') as json_file:
+        reporting_areas = json.load(json_file)['reporting_areas']
+    with open(os.path.join(data_dir, 'methods.json'), 'r') as json_file:
+        always_applicable_methods = json.load(json_file)['methods']
+    techniques = read_techniques(os.path.join(data_dir, 'techniques.json'))
+    compiler = CatalogCompiler(reporting_areas, always_applicable_methods, techniques)
+    return compiler.compile(source_digest(data_dir))
+
+
+class MethodRecord(Mapping):
+    # Read-only view of one method of a CompiledCatalog; values are decoded from the
+    # mapped file on access, so workers share the catalog's pages instead of copies
+
+    __slots__ = ('_catalog', 'row')
+
+    def __init__(self, catalog, row):
+        self._catalog = catalog
+        self.row = row
+
+    def __getitem__(self, key):
+        return self._catalog.method_field(self.row, key)
+
+    def __iter__(self):
+        return iter(self._catalog.method_keys(self.row))
+
+    def __len__(self):
+        return len(self._catalog.method_keys(self.row))
+
+    def __repr__(self):
+        return f"<MethodRecord {self._catalog.method_field(self.row, 'name')!r}>"
+
+
+class CompiledCatalog:
+    # Memory-mapped reader for the output of compile_catalog()
+
+    def __init__(self, path):
+        with open(path, 'rb') as catalog_file:
+            self._buffer = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < HEADER.size:
+            raise CatalogFormatError(f"{path} is too short to be a compiled catalog")
+        magic, version, section_count, self._techniques_columns, digest = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != FORMAT_VERSION or section_count != len(SECTIONS):
+            raise CatalogFormatError(f"{path} is not a compiled catalog of format version {FORMAT_VERSION}")
+        self.source_digest = digest
+        self._sections = {
+            name: SECTION.unpack_from(self._buffer, HEADER.size + position * SECTION.size)
+            for position, name in enumerate(SECTIONS)
+        }
+        strings_offset, strings_count = self._sections['strings']
+        self._blob_offset = strings_offset + (strings_count + 1) * UINT32.size
+
+        self.criteria = {}
+        offset, count = self._sections['criteria']
+        for position in range(count):
+            name, vocabulary = CRITERION.unpack_from(self._buffer, offset + position * CRITERION.size)
+            self.criteria[self.string(name)] = (position, self.string_list(vocabulary))
+        self._method_struct = method_struct(len(self.criteria))
+        self._method_keys = {}
+        self._method_extras = {}
+        self.methods = tuple(MethodRecord(self, row) for row in range(self._sections['methods'][1]))
+
+    def close(self):
+        self._buffer.close()
+
+    def _uint(self, section, index):
+        return UINT32.unpack_from(self._buffer, self._sections[section][0] + index * UINT32.size)[0]
+
+    def string(self, sid):
+        if sid == NONE:
+            return None
+        start, end = struct.unpack_from('<II', self._buffer, self._sections['strings'][0] + sid * UINT32.size)
+        return str(self._buffer[self._blob_offset + start:self._blob_offset + end], 'utf-8')
+
+    def string_list(self, list_id):
+        start, end = self._uint('lists', list_id), self._uint('lists', list_id + 1)
+        offset = self._sections['list_items'][0]
+        sids = struct.unpack_from(f'<{end - start}I', self._buffer, offset + start * UINT32.size)
+        return tuple(self.string(sid) for sid in sids)
+
+    def _extras(self, sid):
+        return json.loads(self.string(sid)) if sid != NONE else {}
+
+    def _method_row(self, row):
+        offset = self._sections['methods'][0] + row * self._method_struct.size
+        return self._method_struct.unpack_from(self._buffer, offset)
+
+    def _criterion_columns(self, record, position):
+        start = len(METHOD_STRING_FIELDS) + len(METHOD_LIST_FIELDS) + 2 + position * CRITERION_COLUMNS
+        return record[start:start + CRITERION_COLUMNS]
+
+    def method_extras(self, row):
+        extras = self._method_extras.get(row)
+        if extras is None:
+            extras_sid = self._method_row(row)[len(METHOD_STRING_FIELDS) + len(METHOD_LIST_FIELDS)]
+            extras = self._method_extras[row] = freeze(self._extras(extras_sid))
+        return extras
+
+    def method_flags(self, row):
+        return self._method_row(row)[len(METHOD_STRING_FIELDS) + len(METHOD_LIST_FIELDS) + 1]
+
+    def method_field(self, row, key):
+        record = self._method_row(row)
+        if key in METHOD_STRING_FIELDS:
+            sid = record[METHOD_STRING_FIELDS.index(key)]
+            if sid != NONE:
+                return self.string(sid)
+        elif key in METHOD_LIST_FIELDS:
+            list_id = record[len(METHOD_STRING_FIELDS) + METHOD_LIST_FIELDS.index(key)]
+            if list_id != NONE:
+                return self.string_list(list_id)
+        elif key in self.criteria:
+            has_levels, _, levels, extra_information = self._criterion_columns(record, self.criteria[key][0])
+            if has_levels:
+                return MappingProxyType({'levels': self.string_list(levels),
+                                         'extra_information': self.string(extra_information)})
+        return self.method_extras(row)[key]
+
+    def method_keys(self, row):
+        keys = self._method_keys.get(row)
+        if keys is None:
+            record = self._method_row(row)
+            keys = [key for position, key in enumerate(METHOD_STRING_FIELDS + METHOD_LIST_FIELDS)
+                    if record[position] != NONE]
+            keys.extend(name for name, (position, _) in self.criteria.items()
+                        if self._criterion_columns(record, position)[0])
+            keys.extend(self.method_extras(row))
+            keys = self._method_keys[row] = tuple(keys)
+        return keys
+
+    def level_masks(self, criterion):
+        # (has levels, level mask) of every method for a level criterion, with the
+        # criterion's level vocabulary; None if the criterion isn't compiled
+        if criterion not in self.criteria:
+            return None
+        position, vocabulary = self.criteria[criterion]
+        masks = [self._criterion_columns(self._method_row(row), position)[:2] for row in range(len(self.methods))]
+        return vocabulary, masks
+
+    def indexed_methods(self):
+        # The methods flatten_methods() would return, in the same order
+        return tuple(method for method in self.methods if self.method_flags(method.row) & INDEXED)
+
+    def always_applicable_methods(self):
+        return tuple(method for method in self.methods if self.method_flags(method.row) & ALWAYS_APPLICABLE)
+
+    def _area_rows(self, section):
+        offset, count = self._sections[section]
+        return [AREA.unpack_from(self._buffer, offset + position * AREA.size) for position in range(count)]
+
+    def reporting_areas(self):
+        # The reporting_area.json tree, with the compiled method records as its methods
+        subsections = self._area_rows('subsections')
+        areas = []
+        for name, description, first, count, extras in self._area_rows('areas'):
+            area = {**self._named(name, description), **freeze(self._extras(extras))}
+            if count != NONE:
+                area['subsections'] = []
+                for sub_name, sub_description, first_method, method_count, sub_extras in subsections[first:first + count]:
+                    subsection = {**self._named(sub_name, sub_description), **freeze(self._extras(sub_extras))}
+                    if method_count != NONE:
+                        subsection['methods'] = self.methods[first_method:first_method + method_count]
+                    area['subsections'].append(MappingProxyType(subsection))
+                area['subsections'] = tuple(area['subsections'])
+            areas.append(MappingProxyType(area))
+        return tuple(areas)
+
+    def _named(self, name, description):
+        fields = {}
+        if name != NONE:
+            fields['name'] = self.string(name)
+        if description != NONE:
+            fields['description'] = self.string(description)
+        return fields
+
+    def techniques(self):
+        # Rows of techniques.json keyed by column name
+        columns = self.string_list(self._techniques_columns)
+        row_struct = struct.Struct(f'<{len(columns)}I')
+        offset, count = self._sections['techniques']
+        rows = (row_struct.unpack_from(self._buffer, offset + position * row_struct.size) for position in range(count))
+        return tuple(MappingProxyType(dict(zip(columns, map(self.string, row)))) for row in rows)
+
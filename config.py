@@ -0,0 +1,96 @@
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        # SQLite connections are cheap to open, and locking is tuned through the
+        # pragmas set when a connection is made
+        return {}
+    return {
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_pre_ping': True,
+    }
+
+
+class Config:
+    # Signs the session cookie and the credential stamps of logged-in users. Required:
+    # create_app() refuses to start without it, except in debug and testing mode, where
+    # a random key is made up for the process.
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Where session data lives: "cookie" (signed, client side), "sql" (a table in the
+    # database) or "filesystem" (files in SESSION_FILE_DIR, instance/sessions by
+    # default). See sessions.py.
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR')
+    SESSION_SWEEP_INTERVAL = env_int('SESSION_SWEEP_INTERVAL', 3600)
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_BUSY_TIMEOUT_MS = env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    LONGLIST_CACHE_SIZE = env_int('LONGLIST_CACHE_SIZE', 1024)
+    LONGLIST_CACHE_TTL = env_int('LONGLIST_CACHE_TTL', 3600)
+
+    # Rendered template fragments, see rendering.py. With FRAGMENT_CACHE_DIR set they are
+    # also stored on disk and shared by all workers on the machine, up to
+    # FRAGMENT_CACHE_DIR_SIZE files.
+    FRAGMENT_CACHE_SIZE = env_int('FRAGMENT_CACHE_SIZE', 2048)
+    FRAGMENT_CACHE_TTL = env_int('FRAGMENT_CACHE_TTL', 86400)
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')
+    FRAGMENT_CACHE_DIR_SIZE = env_int('FRAGMENT_CACHE_DIR_SIZE', 20000)
+
+    # Password hashing and login throttling, see passwords.py
+    BCRYPT_LOG_ROUNDS = env_int('BCRYPT_LOG_ROUNDS', 12)
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', 0)
+    PASSWORD_HASH_QUEUE_DEPTH = env_int('PASSWORD_HASH_QUEUE_DEPTH', 32)
+    PASSWORD_HASH_TIMEOUT = env_int('PASSWORD_HASH_TIMEOUT', 10)
+    LOGIN_FAILURE_BURST = env_int('LOGIN_FAILURE_BURST', 5)
+    LOGIN_FAILURE_REFILL_SECONDS = env_int('LOGIN_FAILURE_REFILL_SECONDS', 60)
+
+    # Process cache of logged-in identities by session, disabled with a TTL of 0
+    IDENTITY_CACHE_TTL = env_int('IDENTITY_CACHE_TTL', 0)
+    IDENTITY_CACHE_SIZE = env_int('IDENTITY_CACHE_SIZE', 4096)
+
+    # Request instrumentation, see instrumentation.Instrumentation
+    INSTRUMENTATION_ENABLED = env_flag('INSTRUMENTATION_ENABLED')
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+    METRICS_LOG_INTERVAL = env_int('METRICS_LOG_INTERVAL', 0)
+    PROFILE_SAMPLE_RATE = env_float('PROFILE_SAMPLE_RATE', 0.0)
+    PROFILE_SLOW_REQUEST_MS = env_int('PROFILE_SLOW_REQUEST_MS', 500)
+
+    # JSON recommendations API, see api.py
+    API_MAX_PROFILES = env_int('API_MAX_PROFILES', 1000)
+    API_COMPRESSION_MIN_SIZE = env_int('API_COMPRESSION_MIN_SIZE', 1024)
+
+    # Bulk project export and import, see transfer.py
+    PROJECT_EXPORT_CHUNK_SIZE = env_int('PROJECT_EXPORT_CHUNK_SIZE', 500)
+    PROJECT_IMPORT_BATCH_SIZE = env_int('PROJECT_IMPORT_BATCH_SIZE', 500)
+
+    # Users who may see the portfolio analytics, comma separated, see analytics.py
+    ADMIN_USERNAMES = tuple(name for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name)
@@ -1,6 +1,50 @@
-from app import db, app  # Import both the database instance and Flask app
+from sqlalchemy import text
+
+from app import create_app, db
+
+# Unique (project, ...) pairs enforced by indexes; duplicates left by older versions
+# of the app have to go before the indexes can be created
+UNIQUE_PAIRS = {
+    'project_criteria': ('project_id', 'criteria_id'),
+    'selected_technique': ('project_id', 'technique_name'),
+}
+
+
+def remove_duplicate_rows():
+    inspector = db.inspect(db.engine)
+    for table, columns in UNIQUE_PAIRS.items():
+        if not inspector.has_table(table):
+            continue
+        # Keep the oldest row of every pair
+        db.session.execute(text(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY {', '.join(columns)})"
+        ))
+    db.session.commit()
+
+
+def add_missing_columns():
+    # create_all() doesn't alter existing tables, so add the (nullable) columns
+    # introduced since
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    db.session.commit()
+
 
 # Create an application context
-with app.app_context():
+with create_app().app_context():
+    remove_duplicate_rows()
     db.create_all()
+    add_missing_columns()
+    # create_all() skips tables that already exist, so add indexes introduced since
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
     print("Database tables created successfully!")
@@ -0,0 +1,69 @@
+# Checks every project against the current criteria schema after it changed (see
+# seed_data.py), so that requests can tell from a project's criteria_version alone
+# whether it needs new answers:
+#
+#     python flag_stale_projects.py
+#
+# Projects that answered every criterion are stamped with the current version in bulk,
+# a range of project ids at a time; the others keep their older stamp and are flagged
+# as stale. Safe to rerun, e.g. from a scheduler or after an interrupted run.
+from sqlalchemy import func, select, update
+
+from app import CRITERIA_SCHEMA_ID, Criteria, CriteriaSchema, Project, ProjectCriteria, create_app, db
+
+# Project ids per UPDATE, to keep each transaction and its locks short
+BATCH_SIZE = 5000
+
+
+def flag_stale_projects(batch_size=BATCH_SIZE):
+    schema = db.session.get(CriteriaSchema, CRITERIA_SCHEMA_ID)
+    if schema is None:
+        print("No criteria schema yet, run seed_data.py first")
+        return None
+
+    required_criteria_ids = select(Criteria.id)
+    required_count = db.session.query(func.count(Criteria.id)).scalar()
+    max_id = db.session.query(func.max(Project.id)).scalar() or 0
+
+    stamped = 0
+    for first_id in range(1, max_id + 1, batch_size):
+        last_id = first_id + batch_size - 1
+        complete = (
+            select(ProjectCriteria.project_id)
+            .where(
+                ProjectCriteria.project_id.between(first_id, last_id),
+                ProjectCriteria.criteria_id.in_(required_criteria_ids),
+            )
+            .group_by(ProjectCriteria.project_id)
+            .having(func.count(func.distinct(ProjectCriteria.criteria_id)) == required_count)
+        )
+        result = db.session.execute(
+            update(Project)
+            .where(
+                Project.id.between(first_id, last_id),
+                Project.criteria_version.is_distinct_from(schema.version),
+                Project.id.in_(complete),
+            )
+            .values(criteria_version=schema.version)
+            .execution_options(synchronize_session=False)
+        )
+        stamped += result.rowcount
+        db.session.commit()
+
+    stale = db.session.query(func.count(Project.id)).filter(
+        Project.criteria_version.is_distinct_from(schema.version)
+    ).scalar()
+    # Requests may now treat any older stamp as stale without diffing the answers
+    db.session.execute(
+        update(CriteriaSchema)
+        .where(CriteriaSchema.id == CRITERIA_SCHEMA_ID, CriteriaSchema.version == schema.version)
+        .values(projects_checked=True)
+    )
+    db.session.commit()
+    print(f"Criteria schema version {schema.version}: stamped {stamped} projects, {stale} need new answers")
+    return stale
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        flag_stale_projects()
@@ -0,0 +1,54 @@
+# gunicorn settings, picked up automatically from the working directory (see Procfile).
+# The app is created and warmed up once in the master, then forked: the workers share
+# the catalog, method index and compiled templates copy-on-write instead of each
+# building them on its first requests.
+import gc
+import os
+
+from config import env_flag, env_int
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+workers = env_int('WEB_CONCURRENCY', 2)
+# gthread serves GUNICORN_THREADS requests per worker concurrently, e.g. while one
+# of them waits on bcrypt or the database
+threads = env_int('GUNICORN_THREADS', 1)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+preload_app = env_flag('GUNICORN_PRELOAD', True)
+
+# Recycle workers gracefully after a number of requests, spread out by the jitter so
+# they don't all restart at once
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app import warm_up
+
+    warm_up(server.app.wsgi())
+    server.log.info("Warmed up the app before forking workers")
+    # Keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from app import warm_up
+
+        warm_up(worker.wsgi)
+
+
+def post_fork(server, worker):
+    # Never use database connections inherited from the master
+    if not server.cfg.preload_app:
+        return
+    from app import db
+
+    with worker.app.wsgi().app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,53 @@
+# Offline import of the techniques spreadsheet into static/data/techniques.json, the
+# file build_catalog.py compiles. Only this command needs openpyxl; rerun it after
+# editing techniques.xlsx.
+#
+#     python import_techniques.py
+import argparse
+import datetime
+import json
+import os
+
+from catalog import DATA_DIR
+
+
+def cell_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def read_techniques(path):
+    # Rows of the first sheet, keyed by the column names in its first row
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+    if not rows:
+        return []
+    # Columns without a name are skipped by position, so the later ones keep their values
+    columns = [(index, str(column)) for index, column in enumerate(rows[0]) if column is not None]
+    return [
+        {column: cell_value(row[index]) if index < len(row) else None for index, column in columns}
+        for row in rows[1:]
+        if any(value is not None for value in row)
+    ]
+
+
+def import_techniques(source, output):
+    techniques = read_techniques(source)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump({'techniques': techniques}, output_file, indent=2, ensure_ascii=False)
+        output_file.write('\n')
+    print(f"Wrote {len(techniques)} techniques to {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert techniques.xlsx into techniques.json.")
+    parser.add_argument('--source', default=os.path.join(DATA_DIR, 'techniques.xlsx'))
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'techniques.json'))
+    args = parser.parse_args()
+    import_techniques(args.source, args.output)
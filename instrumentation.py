@@ -0,0 +1,208 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.json_load_seconds = 0.0
+
+    def observe(self, seconds, status_code, sql_queries, sql_seconds, template_seconds, json_load_seconds):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.seconds += seconds
+        for position, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+        self.sql_queries += sql_queries
+        self.sql_seconds += sql_seconds
+        self.template_seconds += template_seconds
+        self.json_load_seconds += json_load_seconds
+
+
+class Instrumentation:
+    # Opt-in per-request instrumentation (INSTRUMENTATION_ENABLED). For every endpoint it
+    # records wall time, SQL statement count and time, template render time and catalog
+    # JSON load time. Metrics are kept per worker process and exposed in Prometheus text
+    # format on METRICS_PATH and/or as a log line every METRICS_LOG_INTERVAL seconds.
+    # Sampled requests (PROFILE_SAMPLE_RATE) are run under cProfile, and the profile
+    # is dumped to PROFILE_DIR when the request took longer than PROFILE_SLOW_REQUEST_MS.
+
+    def __init__(self, app=None, db=None, catalog=None):
+        self.catalog = catalog
+        self.metrics = defaultdict(EndpointMetrics)
+        self.gauge_sources = []
+        self._lock = threading.Lock()
+        self._last_log = time.monotonic()
+        if app is not None:
+            self.init_app(app, db, catalog)
+
+    def init_app(self, app, db, catalog=None):
+        app.config.setdefault('INSTRUMENTATION_ENABLED', False)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        app.config.setdefault('METRICS_LOG_INTERVAL', 0)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_SLOW_REQUEST_MS', 500)
+        app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+        self.app = app
+        self.catalog = catalog or self.catalog
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        if app.config['METRICS_PATH']:
+            app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.metrics_view)
+
+    def add_gauge_source(self, source):
+        # Register a callable returning {metric name: value}; names ending in _total
+        # are exported as counters, the rest as gauges
+        self.gauge_sources.append(source)
+        return source
+
+    def _json_load_seconds(self):
+        return self.catalog.stats()['load_seconds_total'] if self.catalog is not None else 0.0
+
+    def _before_request(self):
+        g.instrumentation = {
+            'started': time.perf_counter(),
+            'sql_queries': 0,
+            'sql_seconds': 0.0,
+            'template_seconds': 0.0,
+            'json_load_seconds': self._json_load_seconds(),
+            'profiler': None,
+        }
+        sample_rate = self.app.config['PROFILE_SAMPLE_RATE']
+        if sample_rate and random.random() < sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                return
+            g.instrumentation['profiler'] = profiler
+
+    def _after_request(self, response):
+        state = g.pop('instrumentation', None)
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state['started']
+        endpoint = request.endpoint or 'unmatched'
+
+        if state['profiler'] is not None:
+            state['profiler'].disable()
+            if elapsed * 1000 >= self.app.config['PROFILE_SLOW_REQUEST_MS']:
+                self._dump_profile(state['profiler'], endpoint, elapsed)
+
+        with self._lock:
+            self.metrics[endpoint].observe(
+                elapsed,
+                response.status_code,
+                state['sql_queries'],
+                state['sql_seconds'],
+                state['template_seconds'],
+                self._json_load_seconds() - state['json_load_seconds'],
+            )
+        self._maybe_log()
+        return response
+
+    def _dump_profile(self, profiler, endpoint, elapsed):
+        profile_dir = self.app.config['PROFILE_DIR']
+        os.makedirs(profile_dir, exist_ok=True)
+        filename = os.path.join(profile_dir, f"{endpoint}-{int(time.time() * 1000)}-{os.getpid()}.prof")
+        profiler.dump_stats(filename)
+        self.app.logger.warning(f"Slow request to {request.path} took {elapsed * 1000:.0f} ms, profile written to {filename}")
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context() and 'instrumentation' in g:
+            g.instrumentation['render_started'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        if has_request_context() and 'instrumentation' in g:
+            started = g.instrumentation.pop('render_started', None)
+            if started is not None:
+                g.instrumentation['template_seconds'] += time.perf_counter() - started
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('query_started', None)
+        if started is not None and has_request_context() and 'instrumentation' in g:
+            g.instrumentation['sql_queries'] += 1
+            g.instrumentation['sql_seconds'] += time.perf_counter() - started
+
+    def _maybe_log(self):
+        interval = self.app.config['METRICS_LOG_INTERVAL']
+        now = time.monotonic()
+        if not interval or now - self._last_log < interval:
+            return
+        self._last_log = now
+        with self._lock:
+            summary = ", ".join(
+                f"{endpoint}: {m.requests} req {m.seconds / m.requests * 1000:.1f} ms avg "
+                f"{m.sql_queries / m.requests:.1f} sql"
+                for endpoint, m in sorted(self.metrics.items())
+            )
+        self.app.logger.info(f"Request metrics (pid {os.getpid()}): {summary}")
+
+    def render_metrics(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            metrics = sorted(self.metrics.items())
+            histogram = []
+            for endpoint, m in metrics:
+                for bound, count in zip(DURATION_BUCKETS, m.buckets):
+                    histogram.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                histogram.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {m.requests}')
+                histogram.append(f'app_request_duration_seconds_sum{{endpoint="{endpoint}"}} {m.seconds}')
+                histogram.append(f'app_request_duration_seconds_count{{endpoint="{endpoint}"}} {m.requests}')
+            metric("app_request_duration_seconds", "histogram", "Request wall time.", histogram)
+            for name, attribute, help_text in (
+                ("app_request_errors_total", "errors", "Requests answered with a 5xx status."),
+                ("app_sql_queries_total", "sql_queries", "SQL statements executed."),
+                ("app_sql_seconds_total", "sql_seconds", "Time spent executing SQL statements."),
+                ("app_template_render_seconds_total", "template_seconds", "Time spent rendering templates."),
+                ("app_json_load_seconds_total", "json_load_seconds", "Time spent loading catalog JSON files."),
+            ):
+                metric(name, "counter", help_text, [
+                    f'{name}{{endpoint="{endpoint}"}} {getattr(m, attribute)}' for endpoint, m in metrics
+                ])
+
+        for source in self.gauge_sources:
+            for name, value in source().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    kind = "counter" if name.endswith("_total") else "gauge"
+                    metric(name, kind, name.replace('_', ' ') + ".", [f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        return Response(self.render_metrics(), mimetype="text/plain; version=0.0.4")
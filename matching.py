@@ -0,0 +1,335 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Criteria answered with a list of names that must contain the method's own value
+MULTI_SELECT_CRITERIA = ("reporting_area", "subsections")
+
+# Priority mapping for levels, used to decide if a method is "beyond capacity"
+LEVEL_PRIORITY = {"Low": 1, "Medium": 2, "High": 3}
+
+# phase_of_project does not have hierarchical levels
+NON_HIERARCHICAL_CRITERIA = ("phase_of_project",)
+
+Classification = namedtuple("Classification", ["fitting", "beyond_capacity", "non_fitting_selected"])
+
+# Why a method doesn't fit one criterion's answer. kind is "not_selected" (the method's
+# reporting area or subsection isn't among the answers), "beyond_capacity" (the method
+# needs more than the answered level) or "level" (the answer isn't one of its levels);
+# accepted holds the values the method is suitable for.
+Mismatch = namedtuple("Mismatch", ["method", "criterion", "kind", "answer", "accepted"])
+
+
+def profile_key(project_answers):
+    # Canonical hash of a project's answers. Multi-select answers are order-insensitive
+    # for classification, so they are sorted before hashing.
+    canonical = {
+        criterion: sorted(set(answer)) if isinstance(answer, (list, tuple)) else answer
+        for criterion, answer in project_answers.items()
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def flatten_methods(reporting_areas, always_applicable_methods):
+    # Collect all methods from reporting areas, tagged with their reporting area and
+    # subsection, followed by the always applicable methods
+    methods = []
+    for reporting_area in reporting_areas:
+        for subsection in reporting_area.get("subsections", []):
+            for method in subsection.get("methods", []):
+                if "name" in method:
+                    methods.append(MappingProxyType({
+                        "reporting_area": reporting_area["name"],
+                        "subsections": subsection["name"],
+                        **method
+                    }))
+                else:
+                    logger.warning(
+                        f"Method in subsection '{subsection['name']}' is missing a 'name' key and will be skipped."
+                    )
+    methods.extend(always_applicable_methods)
+    return methods
+
+
+def answer_key(answer):
+    # Hashable form of an answer
+    return tuple(answer) if isinstance(answer, list) else answer
+
+
+def mismatch(method, criterion, answer):
+    # The Mismatch of a method that failed a criterion. Methods lacking the field, or
+    # with a malformed one, give a record without accepted values instead of an error.
+    field = method.get(criterion)
+    if criterion in MULTI_SELECT_CRITERIA:
+        accepted = (field,) if isinstance(field, str) and field else ()
+        answer = tuple(answer.split(",")) if isinstance(answer, str) else answer_key(answer)
+        return Mismatch(method.get("name"), criterion, "not_selected", answer, accepted)
+
+    levels = field.get("levels") if hasattr(field, "get") else None
+    accepted = tuple(level for level in levels if isinstance(level, str)) if isinstance(levels, (list, tuple)) else ()
+    kind = "level"
+    if criterion not in NON_HIERARCHICAL_CRITERIA and isinstance(answer, str):
+        valid_levels = [LEVEL_PRIORITY[level] for level in accepted if level in LEVEL_PRIORITY]
+        if valid_levels and max(valid_levels) < LEVEL_PRIORITY.get(answer, 0):
+            kind = "beyond_capacity"
+    return Mismatch(method.get("name"), criterion, kind, answer_key(answer), accepted)
+
+
+@functools.lru_cache(maxsize=4096)
+def mismatch_message(mismatch):
+    # The sentence the longlist shows for a Mismatch, formatted once per (method,
+    # criterion, answer)
+    label = mismatch.criterion.replace("_", " ")
+    answer = ", ".join(mismatch.answer) if isinstance(mismatch.answer, tuple) else mismatch.answer
+    accepted = ", ".join(mismatch.accepted) if mismatch.accepted else "other answers"
+    return f"Your selected {label} is '{answer}', but this method is suitable for {accepted}."
+
+
+class UnknownCriterion(KeyError):
+    # A criterion name that isn't in the catalog's criteria
+    pass
+
+
+def criteria_options(criteria):
+    # Criterion name -> its options, stripped, from the catalog's criteria list
+    return MappingProxyType({
+        criterion["name"]: frozenset(option.strip() for option in criterion["options"].split(","))
+        for criterion in criteria
+    })
+
+
+class CriterionIndex:
+    # Inverted index of one criterion: for every accepted value, the bitset of methods
+    # accepting it, plus the methods that don't constrain the criterion at all
+
+    def __init__(self, name):
+        self.name = name
+        self.unconstrained = 0
+        self.by_value = {}
+        # Methods whose highest level priority is below 1, 2 and 3 respectively
+        self.below_priority = {priority: 0 for priority in LEVEL_PRIORITY.values()}
+
+    def add(self, position, field):
+        bit = 1 << position
+        if self.name in MULTI_SELECT_CRITERIA:
+            if not field:
+                self.unconstrained |= bit
+            else:
+                self.by_value[field] = self.by_value.get(field, 0) | bit
+            return
+
+        if not field or not hasattr(field, "get") or not isinstance(field.get("levels"), (list, tuple)):
+            self.unconstrained |= bit
+            return
+        self.add_levels(position, field["levels"])
+
+    def add_level_mask(self, position, mask, vocabulary):
+        # Same as add() for a compiled level field, given as a bitmask over `vocabulary`
+        self.add_levels(position, [level for bit, level in enumerate(vocabulary) if mask >> bit & 1])
+
+    def add_levels(self, position, levels):
+        bit = 1 << position
+        for level in levels:
+            self.by_value[level] = self.by_value.get(level, 0) | bit
+
+        if self.name in NON_HIERARCHICAL_CRITERIA:
+            return
+        valid_levels = [LEVEL_PRIORITY[level] for level in levels if level in LEVEL_PRIORITY]
+        if not valid_levels:
+            # Methods without valid levels are never beyond capacity on this criterion
+            return
+        max_method_priority = max(valid_levels)
+        for priority in self.below_priority:
+            if max_method_priority < priority:
+                self.below_priority[priority] |= bit
+
+    def fitting(self, answer):
+        # Bitset of methods that fit the given answer
+        if self.name in MULTI_SELECT_CRITERIA:
+            if isinstance(answer, str):
+                answer = answer.split(",")
+            mask = self.unconstrained
+            for value in answer:
+                mask |= self.by_value.get(value, 0)
+            return mask
+        if isinstance(answer, (list, tuple)):
+            return self.unconstrained
+        return self.unconstrained | self.by_value.get(answer, 0)
+
+    def beyond_capacity(self, answer):
+        # Bitset of methods whose highest level is below the answer's level
+        if self.name in NON_HIERARCHICAL_CRITERIA or not isinstance(answer, str):
+            return 0
+        return self.below_priority.get(LEVEL_PRIORITY.get(answer, 0), 0)
+
+
+class MethodIndex:
+    # The catalog compiled into per-criterion bitsets over all methods, so that a
+    # project's answers are classified with a handful of integer operations per criterion
+
+    def __init__(self, methods, version=None, compiled=None, criteria=None):
+        self.version = version
+        self.methods = tuple(methods)
+        # Options per criterion (see criteria_options()); when given, only these
+        # criteria are indexed
+        self.criteria_options = criteria
+        # The CompiledCatalog the methods come from, if any, whose level bitmasks
+        # are used to build the criterion indexes
+        self.compiled = compiled
+        self.all_mask = (1 << len(self.methods)) - 1
+
+        # Pre-index methods by name for faster lookups
+        self.methods_by_name = {method["name"]: method for method in self.methods}
+        self.positions_by_name = {}
+        for position, method in enumerate(self.methods):
+            self.positions_by_name.setdefault(method["name"], 0)
+            self.positions_by_name[method["name"]] |= 1 << position
+
+        self._criteria = {}
+        self._criteria_lock = threading.Lock()
+
+    def criterion(self, name):
+        # Criteria are compiled on first use and kept for the life of the index, so
+        # names outside the catalog's criteria are refused rather than indexed
+        index = self._criteria.get(name)
+        if index is None:
+            if self.criteria_options is not None and name not in self.criteria_options:
+                raise UnknownCriterion(name)
+            with self._criteria_lock:
+                index = self._criteria.get(name)
+                if index is None:
+                    index = CriterionIndex(name)
+                    level_masks = self.compiled.level_masks(name) if self.compiled is not None else None
+                    if level_masks is None:
+                        for position, method in enumerate(self.methods):
+                            index.add(position, method.get(name))
+                    else:
+                        vocabulary, masks = level_masks
+                        for position, method in enumerate(self.methods):
+                            has_levels, mask = masks[method.row]
+                            if has_levels:
+                                index.add_level_mask(position, mask, vocabulary)
+                            else:
+                                index.add(position, method.get(name))
+                    self._criteria[name] = index
+        return index
+
+    def selected_mask(self, method_names):
+        mask = 0
+        for name in method_names:
+            mask |= self.positions_by_name.get(name, 0)
+        return mask
+
+    def methods_in(self, mask):
+        return [method for position, method in enumerate(self.methods) if mask >> position & 1]
+
+    def criterion_masks(self, criterion, answer, criterion_masks=None):
+        # (fitting, beyond capacity) masks of one criterion's answer. `criterion_masks`
+        # memoizes them per (criterion, answer), e.g. across the profiles of a batch and
+        # between classifying and explaining.
+        if criterion_masks is None:
+            index = self.criterion(criterion)
+            return index.fitting(answer), index.beyond_capacity(answer)
+        key = (criterion, answer_key(answer))
+        masks = criterion_masks.get(key)
+        if masks is None:
+            index = self.criterion(criterion)
+            masks = criterion_masks[key] = index.fitting(answer), index.beyond_capacity(answer)
+        return masks
+
+    def answer_masks(self, project_answers, criterion_masks=None):
+        fitting = self.all_mask
+        beyond_capacity = 0
+        for criterion, answer in project_answers.items():
+            masks = self.criterion_masks(criterion, answer, criterion_masks)
+            fitting &= masks[0]
+            beyond_capacity |= masks[1]
+        return fitting, beyond_capacity & ~fitting
+
+    def mismatches(self, project_answers, mask, criterion_masks=None):
+        # (method, [Mismatch, ...]) for the methods in `mask`, in index order. Which
+        # criteria a method fails is read off the per-criterion masks the classification
+        # uses; only the fields of those criteria are looked at.
+        failed = [
+            (criterion, answer, ~self.criterion_masks(criterion, answer, criterion_masks)[0])
+            for criterion, answer in project_answers.items()
+        ]
+        explained = []
+        for position, method in enumerate(self.methods):
+            if not mask >> position & 1:
+                continue
+            explained.append((method, [
+                mismatch(method, criterion, answer)
+                for criterion, answer, failed_mask in failed if failed_mask >> position & 1
+            ]))
+        return explained
+
+    def classify_masks(self, project_answers, selected_names=(), cache=None):
+        # The answer-dependent masks are shared by every project with the same answers,
+        # so they are memoized in `cache` (a caching.TTLCache) when one is given
+        if cache is None:
+            fitting, beyond_capacity = self.answer_masks(project_answers)
+        else:
+            key = (self.version, profile_key(project_answers))
+            masks = cache.get(key)
+            if masks is None:
+                masks = self.answer_masks(project_answers)
+                cache.set(key, masks)
+            fitting, beyond_capacity = masks
+        non_fitting_selected = self.selected_mask(selected_names) & ~fitting
+        return fitting, beyond_capacity, non_fitting_selected
+
+    def classify_batch(self, profiles, cache=None, criterion_masks=None):
+        # (fitting, beyond capacity) masks for many answer profiles in one pass. Identical
+        # profiles are classified once, and each criterion's mask for a given answer is
+        # computed once for the whole batch.
+        if criterion_masks is None:
+            criterion_masks = {}
+        masks_by_key = {}
+        results = []
+        for project_answers in profiles:
+            key = (self.version, profile_key(project_answers))
+            masks = masks_by_key.get(key)
+            if masks is None and cache is not None:
+                masks = cache.get(key)
+            if masks is None:
+                masks = self.answer_masks(project_answers, criterion_masks)
+                if cache is not None:
+                    cache.set(key, masks)
+            masks_by_key[key] = masks
+            results.append(masks)
+        return results
+
+    def classify(self, project_answers, selected_names=(), cache=None):
+        return Classification(*(self.methods_in(mask)
+                                for mask in self.classify_masks(project_answers, selected_names, cache)))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def method_index(catalog):
+    # Compiled index for the catalog's current version, rebuilt after a reload
+    global _index
+    version, data = catalog.snapshot()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _index
+            if index is None or index.version != version:
+                compiled = data.get("compiled")
+                criteria = criteria_options(data["criteria"])
+                if compiled is not None:
+                    index = MethodIndex(compiled.indexed_methods(), version, compiled, criteria)
+                else:
+                    index = MethodIndex(flatten_methods(data["reporting_areas"], data["methods"]), version,
+                                        criteria=criteria)
+                _index = index
+    return index
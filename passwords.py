@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+# bcrypt only looks at the first 72 bytes of a password; older versions of the
+# library truncated silently and newer ones refuse longer input
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+
+class PasswordHasherBusy(Exception):
+    # Raised when the hashing queue is full and the request should be retried later
+    pass
+
+
+def _encode(password):
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(hashed, password):
+    try:
+        return bcrypt.checkpw(_encode(password), hashed.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def hash_rounds(hashed):
+    # Cost factor stored in a "$2b$<rounds>$..." hash
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    # bcrypt hashing with a configurable cost (BCRYPT_LOG_ROUNDS). With
+    # PASSWORD_HASH_WORKERS > 0 the work runs in a process pool of that size, and at most
+    # PASSWORD_HASH_QUEUE_DEPTH hashes may be running or waiting at once; beyond that
+    # PasswordHasherBusy is raised instead of letting requests pile up behind bcrypt.
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.timeout = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 0)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_DEPTH', 32)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_DEPTH'])
+
+    def _get_pool(self):
+        # Created on first use, so that gunicorn workers each get their own pool
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_pool().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash is done, not just until this request gives up
+        # waiting, so timed out hashes still count against the queue depth
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+
+    def generate_password_hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check_password_hash(self, hashed, password):
+        return self._run(_check_password, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class LoginThrottle:
+    # In-process token bucket per username. Every failed login takes a token; when a
+    # username has none left, further attempts are refused until tokens refill at one
+    # per LOGIN_FAILURE_REFILL_SECONDS, up to LOGIN_FAILURE_BURST.
+
+    def __init__(self, app=None, max_tracked=10000):
+        self.burst = 5
+        self.refill_seconds = 60
+        self.max_tracked = max_tracked
+        self._buckets = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_FAILURE_BURST', 5)
+        app.config.setdefault('LOGIN_FAILURE_REFILL_SECONDS', 60)
+        self.burst = app.config['LOGIN_FAILURE_BURST']
+        self.refill_seconds = app.config['LOGIN_FAILURE_REFILL_SECONDS']
+
+    def _tokens(self, username, now):
+        tokens, updated = self._buckets.get(username, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) / self.refill_seconds)
+
+    def allowed(self, username):
+        with self._lock:
+            return self._tokens(username, time.monotonic()) >= 1
+
+    def record_failure(self, username):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[username] = (max(0.0, self._tokens(username, now) - 1), now)
+            if len(self._buckets) > self.max_tracked:
+                self._prune(now)
+
+    def reset(self, username):
+        with self._lock:
+            self._buckets.pop(username, None)
+
+    def _prune(self, now):
+        # Forget usernames whose bucket has refilled completely
+        for username in [name for name in self._buckets if self._tokens(name, now) >= self.burst]:
+            del self._buckets[username]
@@ -0,0 +1,15 @@
+# Rebuilds the portfolio analytics summary tables from the project tables (see
+# analytics.py). The app keeps them up to date by itself afterwards; rerun this after
+# changing projects outside the app, e.g. by hand in the database.
+#
+#     python refresh_analytics.py
+import time
+
+from app import analytics, create_app
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        started = time.perf_counter()
+        analytics.refresh()
+        summary = analytics.summary()
+        print(f"Refreshed the analytics of {summary['projects']} projects in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,104 @@
+import glob
+import hashlib
+import json
+import os
+
+from flask import request, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+def cache_key(parts):
+    return hashlib.sha1(json.dumps(list(parts), default=str).encode('utf-8')).hexdigest()
+
+
+class FragmentCache:
+    # In-process LRU in front of an optional DiskCache shared by all workers
+
+    def __init__(self, memory, disk=None, version=''):
+        self.memory = memory
+        self.disk = disk
+        # Part of every key, so that fragments rendered by older templates are never served
+        self.version = version
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        return self.memory.stats()
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache "name", key, ... %}...{% endcache %} renders its body once per distinct
+    # key and serves the stored HTML afterwards. The keys must cover everything the body
+    # depends on. Without a cache set on the environment the body is always rendered.
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = cache_key([cache.version, *parts])
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = str(caller())
+            cache.set(key, fragment)
+        return Markup(fragment)
+
+
+def template_version(app):
+    # Hash of the template sources and asset manifest, so ETags change with a deploy
+    digest = hashlib.sha1()
+    paths = sorted(glob.glob(os.path.join(app.root_path, app.template_folder, '**', '*.html'), recursive=True))
+    paths.append(os.path.join(app.static_folder, 'build', 'manifest.json'))
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def page_etag(*parts):
+    return cache_key(parts)
+
+
+def is_not_modified(etag):
+    # Pending flash messages are only shown by rendering the page, so never answer 304 then
+    if session.get('_flashes'):
+        return False
+    return request.if_none_match.contains(etag)
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Let browsers keep the page but revalidate it every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
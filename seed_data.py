@@ -1,27 +1,54 @@
-from app import app, db, Criteria
+from app import analytics, create_app, db, Criteria, CriteriaSchema, CRITERIA_SCHEMA_ID, ProjectCriteria
+from flag_stale_projects import flag_stale_projects
+import hashlib
 import json
 
-def seed_criteria():
-    # Clear the Criteria table to prevent duplicates
-    db.session.query(Criteria).delete()
-    db.session.commit()
+def criteria_digest(names):
+    return hashlib.sha1(json.dumps(sorted(names)).encode('utf-8')).hexdigest()
 
+def seed_criteria():
     # Load criteria from JSON file
     with open('static/data/criteria.json', 'r') as file:
         criteria_list = json.load(file)
 
-    # Add criteria dynamically
+    # Update the criteria by name, so that their ids and the projects' answers to them
+    # are kept, and add the new ones
+    existing = {criterion.name: criterion for criterion in Criteria.query.all()}
     for criterion in criteria_list:
-        new_criterion = Criteria(
-            name=criterion['name'],
-            options=criterion['options']
+        if criterion['name'] in existing:
+            existing.pop(criterion['name']).options = criterion['options']
+        else:
+            db.session.add(Criteria(name=criterion['name'], options=criterion['options']))
+
+    # Criteria no longer in the file are removed with their answers
+    removed_ids = [criterion.id for criterion in existing.values()]
+    if removed_ids:
+        db.session.query(ProjectCriteria).filter(ProjectCriteria.criteria_id.in_(removed_ids)).delete(
+            synchronize_session=False
         )
-        db.session.add(new_criterion)
+        db.session.query(Criteria).filter(Criteria.id.in_(removed_ids)).delete(synchronize_session=False)
+        analytics.criteria_removed(removed_ids)
+
+    # A new schema version when the set of criteria changed, which the projects answered
+    # before have to be checked against again
+    digest = criteria_digest(criterion['name'] for criterion in criteria_list)
+    schema = db.session.get(CriteriaSchema, CRITERIA_SCHEMA_ID)
+    changed = schema is None or schema.digest != digest
+    if schema is None:
+        db.session.add(CriteriaSchema(id=CRITERIA_SCHEMA_ID, version=1, digest=digest, projects_checked=False))
+    elif changed:
+        schema.version += 1
+        schema.digest = digest
+        schema.projects_checked = False
 
-    # Commit the new entries
+    # Commit the changes
     db.session.commit()
+    return changed
 
 
 # Run the seeding within the app context
-with app.app_context():
-    seed_criteria()
+if __name__ == '__main__':
+    with create_app().app_context():
+        if seed_criteria():
+            print("The criteria changed, checking the projects against them")
+            flag_stale_projects()
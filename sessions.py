@@ -0,0 +1,233 @@
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import Column, Float, Index, String, Table, Text, delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+# Session ids are secrets.token_urlsafe() strings; anything else in the cookie is ignored
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        # Id the session had before regenerate(), whose record is deleted on save
+        self.replaced_sid = None
+
+    def regenerate(self):
+        # Keep the data under a new session id from this response on
+        if self.sid is not None:
+            self.replaced_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+
+def regenerate_session():
+    # New session id on login and logout, so that an id planted in the browser before
+    # (session fixation) is never authenticated. The cookie session holds no id.
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+class SQLSessionStore:
+    # Sessions as rows of a table in the app's database. Uses its own connections, so
+    # saving a session never commits or rolls back the request's work.
+
+    def __init__(self, db):
+        self.db = db
+        self.table = Table(
+            'session_store', db.metadata,
+            Column('id', String(64), primary_key=True),
+            Column('data', Text, nullable=False),
+            Column('expires_at', Float, nullable=False),
+            Index('ix_session_store_expires_at', 'expires_at'),
+        )
+
+    def load(self, sid):
+        with self.db.engine.connect() as connection:
+            row = connection.execute(
+                select(self.table.c.data, self.table.c.expires_at).where(self.table.c.id == sid)
+            ).first()
+        return (row.data, row.expires_at) if row is not None else None
+
+    def save(self, sid, data, expires_at):
+        with self.db.engine.begin() as connection:
+            updated = connection.execute(
+                update(self.table).where(self.table.c.id == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(insert(self.table).values(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid):
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def sweep(self, now):
+        with self.db.engine.begin() as connection:
+            return connection.execute(delete(self.table).where(self.table.c.expires_at <= now)).rowcount
+
+
+class FilesystemSessionStore:
+    # Sessions as files in `directory`, one per session id, shared by the workers on the
+    # machine. A file's modification time is set to its expiry, so sweeping only stats.
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            path = self._path(sid)
+            expires_at = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as entry:
+                return entry.read(), expires_at
+        except OSError:
+            return None
+
+    def save(self, sid, data, expires_at):
+        # Write to a temporary file first so readers never see a partial session
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(handle, 'w', encoding='utf-8') as entry:
+            entry.write(data)
+        os.utime(temp_path, (expires_at, expires_at))
+        os.replace(temp_path, self._path(sid))
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def sweep(self, now):
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if SESSION_ID.match(entry.name) and entry.stat().st_mtime <= now:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class ServerSessionInterface(SessionInterface):
+    # Keeps session data in a store (SQLSessionStore or FilesystemSessionStore) and only
+    # a random session id in the cookie, so flash-heavy requests don't grow the cookie
+    # every later request carries and verifies.
+    #
+    # Sessions expire after PERMANENT_SESSION_LIFETIME of inactivity. A session that is
+    # only read is written back once half of its lifetime is used up, not on every
+    # request. Expired sessions are swept from the store by at most one request per
+    # SESSION_SWEEP_INTERVAL seconds and process.
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, sweep_interval=3600):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID.match(sid):
+            stored = self.store.load(sid)
+            if stored is not None and stored[1] > time.time():
+                data, expires_at = stored
+                return ServerSession(self.serializer.loads(data), sid, expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        self._maybe_sweep(app)
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            if session.sid is not None or session.replaced_sid is not None:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        renew = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or renew):
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+    def _maybe_sweep(self, app):
+        if time.monotonic() < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            removed = self.store.sweep(time.time())
+            if removed:
+                app.logger.info(f"Swept {removed} expired sessions")
+        finally:
+            self._sweep_lock.release()
+
+
+class ServerSessions:
+    # Replaces the signed cookie session with the SESSION_BACKEND store, "sql" or
+    # "filesystem" (in SESSION_FILE_DIR), unless it is "cookie"
+
+    def __init__(self, db, app=None):
+        # Defined up front, so that the session table is created with the others
+        self.sql_store = SQLSessionStore(db)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SESSION_BACKEND', 'cookie')
+        app.config.setdefault('SESSION_FILE_DIR', None)
+        app.config.setdefault('SESSION_SWEEP_INTERVAL', 3600)
+
+        backend = app.config['SESSION_BACKEND']
+        if backend == 'cookie':
+            return
+        if backend == 'sql':
+            store = self.sql_store
+        elif backend == 'filesystem':
+            store = FilesystemSessionStore(app.config['SESSION_FILE_DIR'] or os.path.join(app.instance_path, 'sessions'))
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND '{backend}', expected cookie, sql or filesystem")
+        app.session_interface = ServerSessionInterface(store, app.config['SESSION_SWEEP_INTERVAL'])
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def app(request, tmp_path, monkeypatch):
+    # The app on its own SQLite database, seeded with the criteria. Parametrize it
+    # indirectly with a SESSION_BACKEND to use another session store than the cookie.
+    import seed_data
+    from app import create_app, db
+    from config import Config
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        SESSION_BACKEND = getattr(request, "param", "cookie")
+        SESSION_FILE_DIR = str(tmp_path / "sessions")
+        BCRYPT_LOG_ROUNDS = 4
+
+    # seed_data reads static/data relative to the working directory
+    monkeypatch.chdir(ROOT)
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        seed_data.seed_criteria()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,50 @@
+from sqlalchemy import event
+
+from app import Criteria, Project, ProjectCriteria, SelectedTechnique, User, db, password_hasher
+
+PASSWORD = "test-password"
+
+
+def add_projects(user_id, count):
+    criteria = Criteria.query.all()
+    for number in range(count):
+        project = Project(name=f"Project {number}", user_id=user_id)
+        db.session.add(project)
+        db.session.flush()
+        for criterion in criteria:
+            db.session.add(ProjectCriteria(
+                project_id=project.id, criteria_id=criterion.id, answer=criterion.options.split(",")[0].strip(),
+            ))
+        for technique_number in range(2):
+            db.session.add(SelectedTechnique(project_id=project.id, technique_name=f"Technique {technique_number}"))
+    db.session.commit()
+
+
+def account_queries(app, username, projects):
+    with app.app_context():
+        user = User(username=username, password=password_hasher.generate_password_hash(PASSWORD))
+        db.session.add(user)
+        db.session.commit()
+        add_projects(user.id, projects)
+        engine = db.engine
+
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": PASSWORD})
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/account")
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    assert f"Project {projects - 1}".encode() in response.data
+    return len(statements)
+
+
+def test_account_queries_do_not_grow_with_projects(app):
+    assert account_queries(app, "few", 2) == account_queries(app, "many", 8)
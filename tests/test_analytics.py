@@ -0,0 +1,78 @@
+import json
+import random
+
+from app import Criteria, Project, User, analytics, catalog, db, get_project_answers, password_hasher
+from matching import method_index
+
+PASSWORD = "test-password"
+
+
+def random_form(criteria, rnd, project_name=None):
+    # A questions form submission: mostly the first option of every criterion, and some
+    # reporting areas with a few of their subsections each. Multi-select answers are
+    # stored comma joined, so subsection names with a comma don't survive the export.
+    form = {} if project_name is None else {"project_name": project_name}
+    for name, options in criteria:
+        options = options.split(",")
+        form[f"criteria_{name}"] = options[0] if rnd.random() < 0.7 else rnd.choice(options)
+    areas = rnd.sample(catalog.reporting_areas, rnd.randint(1, len(catalog.reporting_areas)))
+    form["criteria_reporting_area"] = [area["name"] for area in areas]
+    form["criteria_subsections"] = []
+    for area in areas:
+        names = [subsection["name"] for subsection in area["subsections"] if "," not in subsection["name"]]
+        form["criteria_subsections"] += rnd.sample(names, rnd.randint(1, len(names)))
+    return form
+
+
+def fitting_techniques(app, project_id, rnd):
+    with app.app_context():
+        answers = get_project_answers(db.session.get(Project, project_id))
+    fitting, _, _ = method_index(catalog).classify(answers, [])
+    return rnd.sample([method["name"] for method in fitting], min(3, len(fitting)))
+
+
+def summary(app, refresh=False):
+    with app.app_context():
+        if refresh:
+            analytics.refresh()
+        counts = analytics.summary()
+    counts.pop("refreshed_at")
+    return counts
+
+
+def test_incremental_counts_match_a_refresh(app):
+    rnd = random.Random(1)
+    with app.app_context():
+        db.session.add(User(username="alice", password=password_hasher.generate_password_hash(PASSWORD)))
+        db.session.commit()
+        criteria = db.session.query(Criteria.name, Criteria.options).all()
+        analytics.refresh()
+    client = app.test_client()
+    client.post("/login", data={"username": "alice", "password": PASSWORD})
+
+    for number in range(6):
+        client.post("/questions", data=random_form(criteria, rnd, f"Project {number}"))
+    with app.app_context():
+        project_ids = [project_id for (project_id,) in db.session.query(Project.id).order_by(Project.id)]
+    assert len(project_ids) == 6
+
+    for project_id in project_ids:
+        client.post(f"/longlist/{project_id}", data={"technique": fitting_techniques(app, project_id, rnd)})
+    # Changed answers, then a changed selection, of some of the projects
+    for project_id in project_ids[:3]:
+        client.post(f"/questions?project_id={project_id}", data=random_form(criteria, rnd))
+        client.post(f"/longlist/{project_id}", data={"technique": fitting_techniques(app, project_id, rnd)})
+    with app.app_context():
+        project = db.session.get(Project, project_ids[3])
+        technique_name = project.techniques[0].technique_name if project.techniques else "none"
+    client.post(f"/project/{project_ids[3]}/technique/{technique_name}/remove")
+    client.post(f"/delete_project/{project_ids[4]}")
+
+    exported = client.get("/projects/export?format=ndjson").data
+    response = client.post("/projects/import?format=ndjson", data=exported)
+    assert json.loads(response.data.decode().splitlines()[-1])["summary"]["failed"] == 0
+
+    incremental = summary(app)
+    assert incremental["projects"] == 10
+    assert incremental["techniques"]
+    assert incremental == summary(app, refresh=True)
@@ -0,0 +1,102 @@
+import json
+import os
+import random
+
+import pytest
+
+from catalog import DATA_DIR
+from compiled_catalog import CompiledCatalog, compile_catalog
+from matching import MethodIndex, flatten_methods
+
+LEVEL_PRIORITY = {"Low": 1, "Medium": 2, "High": 3}
+
+
+def load_json(filename):
+    with open(os.path.join(DATA_DIR, filename)) as json_file:
+        return json.load(json_file)
+
+
+# The per-method predicates longlist() classified with before the bitset index
+
+def method_fits(method, project_answers):
+    for criterion, answer in project_answers.items():
+        field = method.get(criterion)
+        if criterion in ["reporting_area", "subsections"]:
+            if field and field not in answer:
+                return False
+        elif field and "levels" in field:
+            if answer not in field["levels"]:
+                return False
+    return True
+
+
+def method_beyond_capacity(method, project_answers):
+    for criterion, answer in project_answers.items():
+        if criterion == "phase_of_project":
+            continue
+        field = method.get(criterion)
+        if field and "levels" in field:
+            valid_levels = [LEVEL_PRIORITY[level] for level in field["levels"] if level in LEVEL_PRIORITY]
+            if not valid_levels:
+                continue
+            if LEVEL_PRIORITY.get(answer, 0) > max(valid_levels):
+                return True
+    return False
+
+
+def reference_classification(all_methods, project_answers, selected_methods):
+    fitting = [method for method in all_methods if method_fits(method, project_answers)]
+    beyond_capacity = [
+        method for method in all_methods
+        if method not in fitting and method_beyond_capacity(method, project_answers)
+    ]
+    non_fitting_selected = [
+        method for method in all_methods
+        if method["name"] in selected_methods and not method_fits(method, project_answers)
+    ]
+    return fitting, beyond_capacity, non_fitting_selected
+
+
+def random_profiles(method_names, count=500, seed=1):
+    # Answers as the questions form stores them (options unstripped), some criteria
+    # left out, and a few methods selected
+    rnd = random.Random(seed)
+    options = {criterion["name"]: criterion["options"].split(",") for criterion in load_json("criteria.json")}
+    for _ in range(count):
+        answers = {}
+        for name, values in options.items():
+            if rnd.random() < 0.1:
+                continue
+            if name in ("reporting_area", "subsections"):
+                answers[name] = rnd.sample(values, rnd.randint(1, len(values)))
+            else:
+                # Mostly the first (lowest) option, so that plenty of methods fit
+                answers[name] = values[0] if rnd.random() < 0.7 else rnd.choice(values)
+        yield answers, rnd.sample(method_names, rnd.randint(0, 8))
+
+
+@pytest.fixture(scope="module")
+def reference_methods():
+    return flatten_methods(load_json("reporting_area.json")["reporting_areas"], load_json("methods.json")["methods"])
+
+
+@pytest.fixture(scope="module", params=["json", "compiled"])
+def index(request, reference_methods, tmp_path_factory):
+    if request.param == "json":
+        yield MethodIndex(reference_methods)
+        return
+    path = tmp_path_factory.mktemp("catalog") / "catalog.bin"
+    path.write_bytes(compile_catalog(DATA_DIR))
+    compiled = CompiledCatalog(str(path))
+    yield MethodIndex(compiled.indexed_methods(), compiled=compiled)
+    compiled.close()
+
+
+def test_classify_matches_per_method_predicates(index, reference_methods):
+    names = [method["name"] for method in reference_methods]
+    assert [method["name"] for method in index.methods] == names
+    for project_answers, selected in random_profiles(names):
+        expected = reference_classification(reference_methods, project_answers, selected)
+        classification = index.classify(project_answers, selected)
+        assert [[method["name"] for method in methods] for methods in classification] == \
+            [[method["name"] for method in methods] for methods in expected], project_answers
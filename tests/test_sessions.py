@@ -0,0 +1,119 @@
+import pytest
+
+from app import User, db, set_password
+
+PASSWORD = "test-password"
+
+server_backends = pytest.mark.parametrize("app", ["sql", "filesystem"], indirect=True)
+
+
+def session_id(app, client):
+    cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+    return cookie.value if cookie is not None else None
+
+
+def stored_session(app, sid):
+    # The sql store reads through the app's database session
+    with app.app_context():
+        return app.session_interface.store.load(sid)
+
+
+def client_with_session(app, sid):
+    client = app.test_client()
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], sid)
+    return client
+
+
+def register(client, username):
+    client.post("/register", data={"username": username, "password": PASSWORD})
+
+
+def login(client, username, password=PASSWORD):
+    return client.post("/login", data={"username": username, "password": password})
+
+
+def is_logged_in(client):
+    return client.get("/account").status_code == 200
+
+
+@server_backends
+def test_login_rotates_the_session_id(app):
+    client = app.test_client()
+    # Registering flashes a message, which starts a session before the login
+    register(client, "alice")
+    before = session_id(app, client)
+    assert before is not None
+
+    assert login(client, "alice").status_code == 302
+    after = session_id(app, client)
+    assert after != before
+    assert stored_session(app, before) is None
+    assert is_logged_in(client)
+
+    # The pre-login id (e.g. planted by an attacker) isn't authenticated
+    assert not is_logged_in(client_with_session(app, before))
+
+
+@server_backends
+def test_logout_drops_the_session(app):
+    client = app.test_client()
+    register(client, "alice")
+    login(client, "alice")
+    logged_in = session_id(app, client)
+    assert is_logged_in(client)
+
+    client.get("/logout")
+    assert session_id(app, client) != logged_in
+    assert stored_session(app, logged_in) is None
+    assert not is_logged_in(client)
+    assert not is_logged_in(client_with_session(app, logged_in))
+
+
+@pytest.mark.parametrize("app", ["cookie", "sql", "filesystem"], indirect=True)
+def test_password_change_invalidates_other_sessions(app):
+    register(app.test_client(), "alice")
+    first, second = app.test_client(), app.test_client()
+    login(first, "alice")
+    login(second, "alice")
+    assert is_logged_in(first) and is_logged_in(second)
+
+    with app.app_context():
+        user = User.query.filter_by(username="alice").one()
+        set_password(user, "new-password")
+        db.session.commit()
+
+    assert not is_logged_in(first)
+    assert not is_logged_in(second)
+    login(second, "alice", "new-password")
+    assert is_logged_in(second)
+
+
+@server_backends
+def test_session_holds_no_part_of_the_password_hash(app):
+    client = app.test_client()
+    register(client, "alice")
+    login(client, "alice")
+    data, _ = stored_session(app, session_id(app, client))
+    assert "_user_id" in data
+    with app.app_context():
+        password_hash = User.query.filter_by(username="alice").one().password
+    # Any 8 characters of the hash's salt and digest part
+    assert not any(password_hash[start:start + 8] in data for start in range(7, len(password_hash) - 7))
+
+
+def test_secret_key_is_required_outside_debug_and_testing(tmp_path):
+    from app import create_app
+    from config import Config
+
+    class ProductionConfig(Config):
+        SECRET_KEY = None
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    with pytest.raises(ValueError, match="SECRET_KEY"):
+        create_app(ProductionConfig)
+
+    class TestConfig(ProductionConfig):
+        TESTING = True
+
+    assert create_app(TestConfig).config["SECRET_KEY"]
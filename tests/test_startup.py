@@ -0,0 +1,6 @@
+from benchmarks import startup
+
+
+def test_worker_startup_within_baseline():
+    # Exits with the regressions when the check fails, see benchmarks/startup.py
+    assert startup.main(["--check", "--runs", "3"])["failures"] == []
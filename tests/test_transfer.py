@@ -0,0 +1,104 @@
+import csv
+import json
+
+from app import Criteria, User, catalog, db, password_hasher
+from matching import method_index
+
+PASSWORD = "test-password"
+
+
+def logged_in_client(app, username):
+    with app.app_context():
+        db.session.add(User(username=username, password=password_hasher.generate_password_hash(PASSWORD)))
+        db.session.commit()
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": PASSWORD})
+    return client
+
+
+def valid_project(app, name):
+    # The first option of every criterion, one reporting area with one of its subsections
+    # and a technique from the catalog
+    with app.app_context():
+        criteria = Criteria.query.all()
+    area = catalog.reporting_areas[0]
+    answers = {criterion.name: criterion.options.split(",")[0].strip() for criterion in criteria}
+    answers["reporting_area"] = [area["name"]]
+    answers["subsections"] = [area["subsections"][0]["name"]]
+    return {"name": name, "answers": answers, "techniques": [method_index(catalog).methods[0]["name"]]}
+
+
+def import_projects(client, body, fmt):
+    response = client.post(f"/projects/import?format={fmt}", data=body)
+    assert response.status_code == 200
+    *reports, summary = [json.loads(line) for line in response.data.decode().splitlines()]
+    return reports, summary["summary"]
+
+
+def export_projects(client):
+    response = client.get("/projects/export?format=ndjson")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def comparable(projects):
+    return [(project["name"], project["answers"], project["techniques"]) for project in projects]
+
+
+def test_ndjson_import_skips_bad_rows_and_round_trips(app):
+    client = logged_in_client(app, "alice")
+    first, second = valid_project(app, "First"), valid_project(app, "Second")
+    unknown_technique = {**valid_project(app, "Third"), "techniques": ["No such technique"]}
+    body = b"\n".join([
+        json.dumps(first).encode(),
+        b'{"name": "broken"',
+        b'{"name": "\xff\xfe"}',
+        json.dumps(unknown_technique).encode(),
+        json.dumps(second).encode(),
+    ]) + b"\n"
+
+    reports, summary = import_projects(client, body, "ndjson")
+    assert [(report["row"], report["status"]) for report in reports] == [
+        (1, "created"), (2, "error"), (3, "error"), (4, "error"), (5, "created"),
+    ]
+    assert reports[1]["errors"][0].startswith("invalid JSON")
+    assert reports[2]["errors"] == ["invalid UTF-8"]
+    assert reports[3]["errors"] == ["unknown technique 'No such technique'"]
+    assert summary == {"created": 2, "failed": 3}
+
+    exported = export_projects(client)
+    assert [project["owner"] for project in exported] == ["alice", "alice"]
+    assert comparable(exported) == comparable([first, second])
+
+    # Importing the export again creates the same projects once more
+    body = "".join(json.dumps(project) + "\n" for project in exported).encode()
+    reports, summary = import_projects(client, body, "ndjson")
+    assert summary == {"created": 2, "failed": 0}
+    assert comparable(export_projects(client)) == comparable(exported) * 2
+
+
+def test_csv_import_skips_bad_rows_and_round_trips(app):
+    client = logged_in_client(app, "alice")
+    import_projects(client, json.dumps(valid_project(app, "First")).encode() + b"\n", "ndjson")
+    exported = client.get("/projects/export?format=csv").data
+    header, row = exported.decode().splitlines()
+    columns = len(next(csv.reader([header])))
+
+    body = "\r\n".join([
+        header,
+        row,
+        row + ",extra",
+        # Larger than the csv module's field size limit
+        "," + "x" * (csv.field_size_limit() + 1) + "," * (columns - 2),
+        row,
+    ]).encode() + b"\r\n" + row.replace("First", "\xff").encode("latin-1") + b"\r\n"
+
+    reports, summary = import_projects(client, body, "csv")
+    assert [(report["row"], report["status"]) for report in reports] == [
+        (2, "created"), (3, "error"), (4, "error"), (5, "created"), (6, "error"),
+    ]
+    assert reports[1]["errors"] == ["more values than columns"]
+    assert reports[2]["errors"][0].startswith("malformed CSV")
+    assert reports[4]["errors"] == ["invalid UTF-8"]
+    assert summary == {"created": 2, "failed": 3}
+    assert comparable(export_projects(client)) == comparable(export_projects(client)[:1]) * 3
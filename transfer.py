@@ -0,0 +1,460 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+from collections import defaultdict, namedtuple
+
+from flask import Blueprint, abort, current_app, request, stream_with_context
+from flask_login import current_user, login_required
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from matching import MULTI_SELECT_CRITERIA, method_index
+
+FORMATS = ('ndjson', 'csv')
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Decoding of imported text, see is_valid_text()
+TEXT_ERRORS = 'surrogateescape'
+
+# Joins a project's technique names in a CSV cell (names may contain commas)
+TECHNIQUE_SEPARATOR = '|'
+
+# CSV columns besides one per criterion
+CSV_COLUMNS = ('id', 'name', 'owner', 'techniques')
+
+
+class TransferError(Exception):
+    # The input as a whole can't be read, e.g. an unknown format or CSV header
+    pass
+
+
+# A row that can't be read, yielded by the readers in place of its project, which may be
+# any JSON value (including a string) until it is validated
+RowError = namedtuple('RowError', 'message')
+
+
+def detect_format(filename=None, mimetype=None, default='ndjson'):
+    for fmt, fmt_mimetype in MIMETYPES.items():
+        if mimetype == fmt_mimetype or (filename and filename.lower().endswith('.' + fmt)):
+            return fmt
+    return default
+
+
+def ndjson_lines(projects):
+    for project in projects:
+        yield json.dumps(project, ensure_ascii=False) + '\n'
+
+
+def csv_lines(projects, criteria_names):
+    # One row per project, a column per criterion; multi-select answers are comma joined
+    # like the app stores them
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(['id', 'name', 'owner', *criteria_names, 'techniques'])
+    for project in projects:
+        answers = project['answers']
+        yield line([
+            project['id'],
+            project['name'],
+            project['owner'],
+            *(",".join(answers[name]) if name in MULTI_SELECT_CRITERIA and name in answers else answers.get(name, '')
+              for name in criteria_names),
+            TECHNIQUE_SEPARATOR.join(project['techniques']),
+        ])
+
+
+def is_valid_text(text):
+    # Input is decoded with errors='surrogateescape' (see TEXT_ERRORS), which keeps bytes
+    # that aren't UTF-8 as lone surrogates instead of failing the whole stream
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_ndjson(lines):
+    # (line number, project or RowError) per non-empty line
+    number = 0
+    try:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            if not is_valid_text(line):
+                yield number, RowError("invalid UTF-8")
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as error:
+                yield number, RowError(f"invalid JSON: {error}")
+    except UnicodeDecodeError:
+        # Input decoded strictly can't be read past the bad bytes
+        yield number + 1, RowError("invalid UTF-8, the rest of the input was not read")
+
+
+def read_csv(lines, criteria_names):
+    reader = csv.DictReader(lines)
+    try:
+        header = reader.fieldnames or []
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise TransferError(f"Can't read the CSV header: {error}")
+    unknown = [column for column in header if column not in CSV_COLUMNS and column not in criteria_names]
+    if 'name' not in header or unknown:
+        raise TransferError(f"CSV header must have a 'name' column and only the columns "
+                            f"{', '.join((*CSV_COLUMNS, *criteria_names))}")
+    number = reader.line_num
+    while True:
+        # A malformed line fails only its own row; the reader carries on after it. The
+        # reader's line count may not have moved past a line it failed on.
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            number = max(reader.line_num, number + 1)
+            yield number, RowError(f"malformed CSV: {error}")
+            continue
+        except UnicodeDecodeError:
+            yield number + 1, RowError("invalid UTF-8, the rest of the input was not read")
+            return
+        number = reader.line_num
+        if None in row:
+            yield reader.line_num, RowError("more values than columns")
+            continue
+        if not all(is_valid_text(value) for value in row.values() if value is not None):
+            yield reader.line_num, RowError("invalid UTF-8")
+            continue
+        techniques = row.get('techniques') or ''
+        yield reader.line_num, {
+            'id': row.get('id') or None,
+            'name': row['name'],
+            'owner': row.get('owner') or None,
+            'answers': {name: row[name] for name in criteria_names if row.get(name)},
+            'techniques': techniques.split(TECHNIQUE_SEPARATOR) if techniques else [],
+        }
+
+
+class ProjectTransfer:
+    # Bulk export and import of projects with their criteria answers and selected
+    # techniques, as NDJSON (one project per line) or CSV:
+    #
+    #     {"id": 3, "name": "...", "owner": "alice",
+    #      "answers": {"reporting_area": [...], "budget": "Low", ...}, "techniques": [...]}
+    #
+    # Both run in constant memory. Exports read the projects in PROJECT_EXPORT_CHUNK_SIZE
+    # chunks (yield_per) and load the answers and techniques of a whole chunk at once;
+    # imports validate row by row against the criteria and the catalog and insert the
+    # valid rows PROJECT_IMPORT_BATCH_SIZE at a time. An invalid row is reported and
+    # skipped, the rest of the batch is still imported.
+    #
+    # Logged-in users export and import their own projects on /projects/export and
+    # /projects/import; transfer_projects.py does the same for all users from the shell.
+
+    def __init__(self, db, catalog, user, project, criteria, project_criteria, selected_technique):
+        self.db = db
+        self.catalog = catalog
+        self.User = user
+        self.Project = project
+        self.Criteria = criteria
+        self.ProjectCriteria = project_criteria
+        self.SelectedTechnique = selected_technique
+        self.import_listeners = []
+
+    def init_app(self, app):
+        app.config.setdefault('PROJECT_EXPORT_CHUNK_SIZE', 500)
+        app.config.setdefault('PROJECT_IMPORT_BATCH_SIZE', 500)
+
+        blueprint = Blueprint('transfer', __name__)
+        blueprint.add_url_rule('/projects/export', 'export_projects', login_required(self.export_view))
+        blueprint.add_url_rule('/projects/import', 'import_projects', login_required(self.import_view),
+                               methods=['POST'])
+        app.register_blueprint(blueprint)
+
+    def on_import(self, listener):
+        # listener(answers, techniques) is called with the rows of every imported batch
+        # before they are committed
+        self.import_listeners.append(listener)
+        return listener
+
+    def criteria_names(self):
+        return [name for (name,) in self.db.session.query(self.Criteria.name).order_by(self.Criteria.id)]
+
+    def export_projects(self, user_id=None):
+        session = self.db.session
+        Project, ProjectCriteria, SelectedTechnique = self.Project, self.ProjectCriteria, self.SelectedTechnique
+        criteria_names = dict(session.query(self.Criteria.id, self.Criteria.name))
+
+        query = (
+            select(Project.id, Project.name, self.User.username)
+            .join(self.User, Project.user_id == self.User.id)
+            .order_by(Project.id)
+        )
+        if user_id is not None:
+            query = query.where(Project.user_id == user_id)
+        chunk_size = current_app.config['PROJECT_EXPORT_CHUNK_SIZE']
+        result = session.execute(query.execution_options(yield_per=chunk_size))
+
+        for chunk in result.partitions():
+            project_ids = [project_id for project_id, _, _ in chunk]
+            answers = defaultdict(dict)
+            for project_id, criteria_id, answer in session.execute(
+                select(ProjectCriteria.project_id, ProjectCriteria.criteria_id, ProjectCriteria.answer)
+                .where(ProjectCriteria.project_id.in_(project_ids))
+                .order_by(ProjectCriteria.id)
+            ):
+                name = criteria_names.get(criteria_id)
+                if name is None or answer is None:
+                    continue
+                answers[project_id][name] = answer.split(",") if name in MULTI_SELECT_CRITERIA else answer
+            techniques = defaultdict(list)
+            for project_id, technique_name in session.execute(
+                select(SelectedTechnique.project_id, SelectedTechnique.technique_name)
+                .where(SelectedTechnique.project_id.in_(project_ids))
+                .order_by(SelectedTechnique.id)
+            ):
+                techniques[project_id].append(technique_name)
+
+            for project_id, name, owner in chunk:
+                yield {
+                    'id': project_id,
+                    'name': name,
+                    'owner': owner,
+                    'answers': answers[project_id],
+                    'techniques': techniques[project_id],
+                }
+
+    def export_lines(self, fmt, user_id=None):
+        if fmt == 'csv':
+            return csv_lines(self.export_projects(user_id), self.criteria_names())
+        return ndjson_lines(self.export_projects(user_id))
+
+    def validation_context(self):
+        # Options keyed by their stripped text; answers are stored as the form submits them
+        criteria = {
+            name: {option.strip(): option for option in (options or '').split(",")}
+            for name, options in self.db.session.query(self.Criteria.name, self.Criteria.options)
+        }
+        return {
+            'criteria': criteria,
+            'criteria_ids': dict(self.db.session.query(self.Criteria.name, self.Criteria.id)),
+            'reporting_areas': {
+                area['name']: [subsection['name'] for subsection in area.get('subsections', [])]
+                for area in self.catalog.reporting_areas
+            },
+            'methods_by_name': method_index(self.catalog).methods_by_name,
+            'owners': {},
+        }
+
+    def owner_id(self, username, context):
+        owners = context['owners']
+        if username not in owners:
+            owners[username] = self.db.session.query(self.User.id).filter_by(username=username).scalar()
+        return owners[username]
+
+    def validate(self, project, context, owner_id=None):
+        # (row values for the insert, errors) of one imported project
+        if not isinstance(project, dict):
+            return None, ["a project must be an object"]
+        errors = []
+
+        name = project.get('name')
+        if not isinstance(name, str) or not name.strip():
+            errors.append("'name' is required")
+        elif len(name) > 100:
+            errors.append("'name' is longer than 100 characters")
+
+        if owner_id is None:
+            owner = project.get('owner')
+            owner_id = self.owner_id(owner, context) if isinstance(owner, str) else None
+            if owner_id is None:
+                errors.append(f"unknown owner {owner!r}")
+
+        answers = project.get('answers')
+        if not isinstance(answers, dict):
+            return None, errors + ["'answers' must be an object"]
+        stored_answers = {}
+        for criterion, answer in answers.items():
+            if criterion not in context['criteria']:
+                errors.append(f"unknown criterion '{criterion}'")
+                continue
+            if criterion in MULTI_SELECT_CRITERIA:
+                values = answer.split(",") if isinstance(answer, str) else answer
+                if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                    errors.append(f"'{criterion}' must be a list of names")
+                    continue
+                answer = ",".join(values)
+            elif isinstance(answer, str) and answer.strip() in context['criteria'][criterion]:
+                answer = context['criteria'][criterion][answer.strip()]
+            else:
+                errors.append(f"'{criterion}' must be one of {', '.join(context['criteria'][criterion])}")
+                continue
+            if answer:
+                stored_answers[criterion] = answer
+
+        # The same checks as the questions form
+        areas = stored_answers.get('reporting_area', '').split(",") if 'reporting_area' in stored_answers else []
+        subsections = stored_answers['subsections'].split(",") if 'subsections' in stored_answers else []
+        if not areas:
+            errors.append("at least one reporting area is required")
+        known_subsections = {name for names in context['reporting_areas'].values() for name in names}
+        for area in areas:
+            if area not in context['reporting_areas']:
+                errors.append(f"unknown reporting area '{area}'")
+            elif not any(subsection in subsections for subsection in context['reporting_areas'][area]):
+                errors.append(f"no subsection selected for '{area}'")
+        for subsection in subsections:
+            if subsection not in known_subsections:
+                errors.append(f"unknown subsection '{subsection}'")
+
+        techniques = project.get('techniques', [])
+        if not isinstance(techniques, list) or not all(isinstance(name, str) for name in techniques):
+            errors.append("'techniques' must be a list of method names")
+            techniques = []
+        for technique_name in techniques:
+            if technique_name not in context['methods_by_name']:
+                errors.append(f"unknown technique '{technique_name}'")
+
+        if errors:
+            return None, errors
+        methods_by_name = context['methods_by_name']
+        return {
+            'project': {'name': name, 'user_id': owner_id},
+            'answers': [
+                {'criteria_id': context['criteria_ids'][criterion], 'answer': answer}
+                for criterion, answer in stored_answers.items()
+            ],
+            'techniques': [
+                {
+                    'technique_name': technique_name,
+                    'description': methods_by_name[technique_name]['description'],
+                    'image_filename': methods_by_name[technique_name].get('photo'),
+                }
+                for technique_name in dict.fromkeys(techniques)
+            ],
+        }, []
+
+    def insert_batch(self, rows):
+        # Insert the projects, then all their answers and techniques, as three
+        # multi-row statements; returns the new project ids
+        session = self.db.session
+        project_ids = session.execute(
+            insert(self.Project).returning(self.Project.id, sort_by_parameter_order=True),
+            [row['project'] for row in rows],
+        ).scalars().all()
+        answers = [
+            {**answer, 'project_id': project_id}
+            for project_id, row in zip(project_ids, rows) for answer in row['answers']
+        ]
+        techniques = [
+            {**technique, 'project_id': project_id}
+            for project_id, row in zip(project_ids, rows) for technique in row['techniques']
+        ]
+        if answers:
+            session.execute(insert(self.ProjectCriteria), answers)
+        if techniques:
+            session.execute(insert(self.SelectedTechnique), techniques)
+        for listener in self.import_listeners:
+            listener(answers, techniques)
+        session.commit()
+        return project_ids
+
+    def flush(self, batch):
+        # Reports of a batch in input order. When the batch insert fails the rows are
+        # retried one by one, so that only the failing ones are reported as errors.
+        rows = [(report, row) for report, row in batch if row is not None]
+        if rows:
+            try:
+                project_ids = self.insert_batch([row for _, row in rows])
+            except SQLAlchemyError:
+                self.db.session.rollback()
+                project_ids = []
+                for report, row in rows:
+                    try:
+                        project_ids.extend(self.insert_batch([row]))
+                    except SQLAlchemyError as error:
+                        self.db.session.rollback()
+                        current_app.logger.warning(f"Project import of row {report['row']} failed: {error}")
+                        report.update(status='error', errors=["the database rejected the project"])
+                        project_ids.append(None)
+            for (report, _), project_id in zip(rows, project_ids):
+                if project_id is not None:
+                    report.update(status='created', project_id=project_id)
+        return [report for report, _ in batch]
+
+    def import_projects(self, lines, fmt, owner_id=None):
+        # One report per row, {"row", "id", "status", "project_id" or "errors"}, followed by
+        # {"summary": {"created", "failed"}}
+        context = self.validation_context()
+        rows = read_csv(lines, self.criteria_names()) if fmt == 'csv' else read_ndjson(lines)
+        batch_size = current_app.config['PROJECT_IMPORT_BATCH_SIZE']
+        counts = {'created': 0, 'failed': 0}
+
+        def reported(reports):
+            for report in reports:
+                counts['created' if report['status'] == 'created' else 'failed'] += 1
+                yield report
+
+        batch = []
+        for number, project in rows:
+            report = {'row': number, 'id': project.get('id') if isinstance(project, dict) else None}
+            if isinstance(project, RowError):
+                row, errors = None, [project.message]
+            else:
+                row, errors = self.validate(project, context, owner_id)
+            if errors:
+                report.update(status='error', errors=errors)
+            batch.append((report, row))
+            if len(batch) >= batch_size:
+                yield from reported(self.flush(batch))
+                batch = []
+        yield from reported(self.flush(batch))
+        yield {'summary': counts}
+
+    def export_view(self):
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            abort(400)
+        lines = stream_with_context(self.export_lines(fmt, current_user.id))
+        response = current_app.response_class(lines, mimetype=MIMETYPES[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename=projects.{fmt}'
+        return response
+
+    def import_view(self):
+        # The projects are either the request body or an uploaded "file", in the format
+        # given by ?format=, the content type or the file name. They are imported for the
+        # current user; the response streams the per-row reports as NDJSON.
+        upload = request.files.get('file')
+        if upload is not None:
+            fmt = detect_format(upload.filename, upload.mimetype)
+            # Uploads are closed with the request, before the response is streamed
+            stream = tempfile.TemporaryFile()
+            shutil.copyfileobj(upload.stream, stream)
+            stream.seek(0)
+        else:
+            fmt = detect_format(mimetype=request.mimetype)
+            stream = request.stream
+        fmt = request.args.get('format', fmt)
+        if fmt not in FORMATS:
+            abort(400)
+        lines = io.TextIOWrapper(stream, encoding='utf-8-sig', errors=TEXT_ERRORS, newline='')
+
+        def reports():
+            try:
+                for report in self.import_projects(lines, fmt, current_user.id):
+                    yield json.dumps(report, ensure_ascii=False) + '\n'
+            except TransferError as error:
+                yield json.dumps({'error': str(error)}) + '\n'
+            finally:
+                lines.close()
+
+        return current_app.response_class(stream_with_context(reports()), mimetype=MIMETYPES['ndjson'])
@@ -0,0 +1,100 @@
+# Bulk project export and import from the shell, for all users (see transfer.py):
+#
+#     python transfer_projects.py export projects.ndjson
+#     python transfer_projects.py export projects.csv --user alice
+#     python transfer_projects.py import projects.csv [--user alice] [--report report.ndjson]
+#
+# The format follows the file extension unless given with --format; '-' reads stdin or
+# writes stdout. Imported projects belong to their "owner" column unless --user is given.
+# Rows that fail validation are reported on stderr (or in --report) and skipped; the
+# exit status is 1 when any row failed.
+import argparse
+import json
+import sys
+
+from app import User, create_app, db, project_transfer
+from transfer import FORMATS, TEXT_ERRORS, TransferError, detect_format
+
+
+def open_file(path, mode):
+    if path == '-':
+        if 'w' in mode:
+            return sys.stdout
+        sys.stdin.reconfigure(errors=TEXT_ERRORS)
+        return sys.stdin
+    if 'r' in mode:
+        return open(path, mode, encoding='utf-8-sig', errors=TEXT_ERRORS, newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def user_id(username):
+    if username is None:
+        return None
+    found = db.session.query(User.id).filter_by(username=username).scalar()
+    if found is None:
+        sys.exit(f"Unknown user '{username}'")
+    return found
+
+
+def export_projects(args):
+    fmt = args.format or detect_format(args.path)
+    output = open_file(args.path, 'w')
+    count = 0
+    try:
+        for line in project_transfer.export_lines(fmt, user_id(args.user)):
+            output.write(line)
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if fmt == 'csv':
+        count -= 1
+    print(f"Exported {count} projects to {args.path}", file=sys.stderr)
+
+
+def import_projects(args):
+    fmt = args.format or detect_format(args.path)
+    source = open_file(args.path, 'r')
+    report_file = open(args.report, 'w', encoding='utf-8') if args.report else None
+    summary = None
+    try:
+        for report in project_transfer.import_projects(source, fmt, user_id(args.user)):
+            if report_file is not None:
+                report_file.write(json.dumps(report, ensure_ascii=False) + '\n')
+            if 'summary' in report:
+                summary = report['summary']
+            elif report['status'] == 'error' and report_file is None:
+                print(f"Row {report['row']}: {'; '.join(report['errors'])}", file=sys.stderr)
+    except TransferError as error:
+        sys.exit(str(error))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if report_file is not None:
+            report_file.close()
+    print(f"Imported {summary['created']} projects, {summary['failed']} rows failed", file=sys.stderr)
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or import projects as NDJSON or CSV.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="write projects to a file")
+    export_parser.add_argument('path', help="output file, or - for stdout")
+    export_parser.add_argument('--user', help="only export the projects of this user")
+    export_parser.set_defaults(handler=export_projects)
+
+    import_parser = commands.add_parser('import', help="create projects from a file")
+    import_parser.add_argument('path', help="input file, or - for stdin")
+    import_parser.add_argument('--user', help="import every project for this user instead of its owner")
+    import_parser.add_argument('--report', help="write the per-row results to this NDJSON file")
+    import_parser.set_defaults(handler=import_projects)
+
+    for command_parser in (export_parser, import_parser):
+        command_parser.add_argument('--format', choices=FORMATS, help="file format, by default from the extension")
+
+    args = parser.parse_args()
+    with create_app().app_context():
+        args.handler(args)